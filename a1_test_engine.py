@@ -0,0 +1,710 @@
+"""CSC148 Assignment 1: Engine tests
+
+=== Module description ===
+This module contains tests for the tooling built around the simulation
+engine: benchmarks, instrumentation and the faster data paths.
+"""
+import csv
+from datetime import datetime, timedelta
+import json
+import pstats
+import queue
+import random
+import pytest
+from bikeshare import Ride, to_minutes
+from analytics import ODMatrix, aggregate_files
+from cache import ResultCache
+import differential
+from benchmark import STARTUP_BUDGET, generate_rides, time_startup
+from history import OccupancyHistory
+import loader
+import refresh
+from recorder import PER_CHANGE, StationRecorder
+from rebalancing import RebalancingFleet, Truck
+import shards
+from shards import load_rides, read_manifest, select_groups, write_shards
+from sketches import KLLSketch
+from stochastic import DemandModel, replicate
+from sweep import SweepDataset, sweep
+import viewer
+from viewer import Frame, FrameProducer, Playback, start_producer
+from trajectories import (export_trajectories, iter_chunks,
+                          read_columnar)
+from simulation import (RideStartEvent, Simulation, create_stations,
+                        create_rides)
+
+
+def test_generate_rides_deterministic(tmp_path):
+    """Test that the benchmark generator is reproducible and produces rides
+    that the simulation can load.
+    """
+    first = tmp_path / 'first.csv'
+    second = tmp_path / 'second.csv'
+    generate_rides(str(first), 500, 2, seed=7)
+    generate_rides(str(second), 500, 2, seed=7)
+    assert first.read_text() == second.read_text()
+
+    rides = create_rides(str(first), create_stations('stations.json'))
+    assert len(rides) == 500
+    assert all(ride.start_time < ride.end_time for ride in rides)
+    assert rides == sorted(rides, key=lambda ride: ride.start_time)
+
+
+def test_profile_counters(tmp_path):
+    """Test the counters of a profiled run over the single ride in the
+    9:30 to 9:45 window of the sample data.
+    """
+    sim = Simulation('stations.json', 'sample_rides.csv', visualize=False,
+                     profile=True)
+    sim.run(datetime(2017, 6, 1, 9, 30, 0),
+            datetime(2017, 6, 1, 9, 45, 0))
+
+    profile = sim.profile
+    assert profile.ticks == 15
+    assert profile.events_processed == 2  # The ride's start and end
+    assert profile.max_active_rides == 1
+    assert profile.phase_calls['check_space'] == 15
+    assert profile.phase_calls['listeners'] == 15
+    assert profile.to_dict()['phases']['create_rides']['calls'] == 1
+
+    path = str(tmp_path / 'run.prof')
+    profile.dump_stats(path)
+    assert pstats.Stats(path).total_calls > 0
+
+
+def test_datetime_api():
+    """Test that the handout's methods and Ride attributes still take and
+    give datetime objects, although the engine works in minutes.
+    """
+    sim = Simulation('stations.json', 'sample_rides.csv', visualize=False)
+    sim._update_active_rides(datetime(2017, 6, 1, 9, 35, 0))
+    assert len(sim.active_rides) == 1
+
+    sim = Simulation('stations.json', 'sample_rides.csv', visualize=False)
+    sim.ride_priority_queue.extend(sim.start_events(
+        datetime(2017, 6, 1, 9, 30, 0), datetime(2017, 6, 1, 9, 45, 0)))
+    sim._update_active_rides_fast(datetime(2017, 6, 1, 9, 35, 0))
+    assert len(sim.active_rides) == 1
+
+    ride = sim.all_rides[0]
+    ride.end_time = datetime(2017, 6, 1, 10, 0, 0)
+    assert ride.end_minute == to_minutes(datetime(2017, 6, 1, 10, 0, 0))
+    assert ride.end_time == datetime(2017, 6, 1, 10, 0, 0)
+
+
+def test_active_rides_contract():
+    """Test that the active rides can be looked up and iterated as rides.
+    """
+    sim = Simulation('stations.json', 'sample_rides.csv', visualize=False)
+    sim.run(datetime(2017, 6, 1, 9, 30, 0), datetime(2017, 6, 1, 9, 40, 0))
+    ride = sim.all_rides[-1]
+    assert ride in sim.active_rides
+    assert list(sim.active_rides) == [ride]
+
+
+def test_event_objects_match_tuple_events():
+    """Test that rides scheduled as RideStartEvent objects give the same
+    statistics as the tuple-encoded events used by run.
+    """
+    start = datetime(2017, 6, 1, 8, 0, 0)
+    end = datetime(2017, 6, 1, 9, 0, 0)
+    expected = Simulation('stations.json', 'sample_rides.csv',
+                          visualize=False)
+    expected.run(start, end)
+
+    sim = Simulation('stations.json', 'sample_rides.csv', visualize=False)
+    for ride in sim.all_rides:
+        if start < ride.start_time < end:
+            sim.schedule_event(RideStartEvent(sim, ride.start_minute, ride))
+    # Rides already scheduled above must not be scheduled again by run
+    rides = sim.all_rides
+    sim.all_rides = []
+    sim.run(start, end)
+    sim.all_rides = rides
+
+    assert sim.calculate_statistics() == expected.calculate_statistics()
+    assert len(sim.active_rides) == len(expected.active_rides)
+
+
+def test_od_matrix_merge_and_save(tmp_path):
+    """Test that OD matrices of two halves of a file merge into the matrix
+    of the whole file, and survive a save and load.
+    """
+    lines = open('sample_rides.csv').readlines()
+    first = tmp_path / 'first.csv'
+    second = tmp_path / 'second.csv'
+    first.write_text(''.join(lines[:7]))
+    second.write_text(''.join(lines[7:]))
+
+    whole = aggregate_files('stations.json', ['sample_rides.csv'])
+    merged = aggregate_files('stations.json', [str(first), str(second)],
+                             processes=2)
+    assert merged.counts == whole.counts
+    assert whole.total() == len(create_rides('sample_rides.csv',
+                                             create_stations('stations.json')))
+
+    bucket = whole.bucket_of(datetime(2017, 6, 1, 9, 40))
+    assert whole.count(bucket, '6091', '6052') == 1
+    assert whole.flows(bucket) == {('6091', '6052'): 1}
+
+    path = str(tmp_path / 'od.bin')
+    whole.save(path)
+    loaded = ODMatrix.load(path)
+    assert loaded.counts == whole.counts
+    assert loaded.station_ids == whole.station_ids
+
+
+def test_capacity_sweep():
+    """Test that a sweep without overrides matches a plain simulation, and
+    that overrides change the low availability statistics.
+    """
+    start = datetime(2017, 6, 1, 9, 30, 0)
+    end = datetime(2017, 6, 1, 9, 45, 0)
+    sim = Simulation('stations.json', 'sample_rides.csv', visualize=False)
+    sim.run(start, end)
+
+    # Station 7041 ('15e avenue / Masson') has 3 bikes out of 15, and
+    # station 6919 ('10e Avenue / Rosemont') 10 bikes out of 11
+    configurations = [{}, {'7041': (15, 10), '6919': (11, 0)}]
+    results = sweep('stations.json', 'sample_rides.csv', start, end,
+                    configurations)
+    assert results[0] == sim.calculate_statistics()
+    assert results[1]['max_start'] == results[0]['max_start']
+    assert results[1]['max_time_low_availability'] == (
+        '10e Avenue / Rosemont', 900)
+    assert results[1]['max_time_low_unoccupied'] != (
+        '10e Avenue / Rosemont', 900)
+    assert sweep('stations.json', 'sample_rides.csv', start, end,
+                 configurations, processes=2) == results
+
+    # Rides only move bikes in a tracked sweep; one leaves 6200 at 8:04
+    for track, bikes in [(False, 6), (True, 5)]:
+        dataset = SweepDataset('stations.json', 'sample_rides.csv',
+                               datetime(2017, 6, 1, 8, 0),
+                               datetime(2017, 6, 1, 9, 0), track)
+        notified = []
+        dataset.simulation.add_occupancy_listener(notified.append)
+        dataset.evaluate({'6200': (20, 6)})
+        assert dataset.simulation.all_stations['6200'].num_bikes == bikes
+        assert notified[0] is dataset.simulation.all_stations['6200']
+
+
+def test_result_cache_composes_windows(tmp_path):
+    """Test that cached results are reused, composed from contiguous
+    windows only when no ride crosses their boundary, and persisted.
+    """
+    def direct(start, end):
+        sim = Simulation('stations.json', 'sample_rides.csv', visualize=False)
+        sim.run(start, end)
+        return sim.calculate_statistics()
+
+    files = ('stations.json', 'sample_rides.csv')
+    seven, eight_thirty, nine = (datetime(2017, 6, 1, 7, 0),
+                                 datetime(2017, 6, 1, 8, 30),
+                                 datetime(2017, 6, 1, 9, 0))
+    eight = datetime(2017, 6, 1, 8, 0)
+    cache = ResultCache(directory=str(tmp_path))
+
+    assert cache.statistics(*files, seven, eight) == direct(seven, eight)
+    assert cache.statistics(*files, eight, nine) == direct(eight, nine)
+    assert cache.statistics(*files, eight, nine) == direct(eight, nine)
+    assert (cache.misses, cache.hits) == (2, 1)
+
+    # No ride is active at 8:00, so this is composed from the two above
+    assert cache.statistics(*files, seven, nine) == direct(seven, nine)
+    assert cache.composed == 1
+
+    # Only the last window of a composition may have active rides
+    cache.statistics(*files, eight, eight_thirty)
+    assert cache.statistics(*files, seven, eight_thirty) == \
+        direct(seven, eight_thirty)
+    assert (cache.misses, cache.composed) == (3, 2)
+
+    # A ride from 8:23 to 8:57 crosses 8:30, so this must be simulated
+    other = ResultCache()
+    other.statistics(*files, eight, eight_thirty)
+    other.statistics(*files, eight_thirty, nine)
+    assert other.statistics(*files, eight, nine) == direct(eight, nine)
+    assert (other.misses, other.composed) == (3, 0)
+
+    # A tiny budget keeps a single result in memory, but the others are
+    # still read back from the directory
+    small = ResultCache(max_bytes=1, directory=str(tmp_path))
+    assert small.statistics(*files, seven, eight) == direct(seven, eight)
+    assert small.statistics(*files, eight, nine) == direct(eight, nine)
+    assert (small.hits, small.misses) == (2, 0)
+
+
+def test_rebalancing_trucks():
+    """Test that a truck refills a station that starts empty, and carries
+    out a scheduled move.
+    """
+    sim = Simulation('stations.json', 'sample_rides.csv', visualize=False)
+    empty = sim.all_stations['6023']
+    empty.num_bikes = 0
+    for station in sim.all_stations.values():
+        if station is not empty and station.num_bikes <= 2:
+            station.num_bikes = 3
+
+    truck = Truck('T1', 10, sim.all_stations['6001'])
+    fleet = RebalancingFleet(sim, [truck])
+    fleet.schedule_move(datetime(2017, 6, 1, 8, 30), '6001', '6002')
+    sim.run(datetime(2017, 6, 1, 8, 0), datetime(2017, 6, 1, 10, 0))
+
+    assert sim.track_occupancy
+    assert fleet.moves[0][3] == empty.name and fleet.moves[0][4] > 0
+    assert empty.num_bikes > fleet.low
+    assert (sim.all_stations['6001'].name, sim.all_stations['6002'].name) \
+        in [move[2:4] for move in fleet.moves[1:]]
+    assert truck.bikes_moved == sum(move[4] for move in fleet.moves)
+
+
+def test_rebalancing_across_reset():
+    """Test that a fleet gives the same moves when the simulation is reset
+    and run again from the same stations, and works in a tracked sweep.
+    """
+    sim = Simulation('stations.json', 'sample_rides.csv', visualize=False)
+    initial = {station_id: station.num_bikes
+               for station_id, station in sim.all_stations.items()}
+    truck = Truck('T1', 10, sim.all_stations['6001'])
+    fleet = RebalancingFleet(sim, [truck])
+    assert len(sim.ride_priority_queue) == 0 and not truck.busy
+
+    start, end = datetime(2017, 6, 1, 8, 0), datetime(2017, 6, 1, 10, 0)
+    sim.run(start, end)
+    moves = fleet.moves
+    assert moves
+
+    for station_id, station in sim.all_stations.items():
+        station.num_bikes = initial[station_id]
+    truck.location = sim.all_stations['6001']
+    sim.reset()
+    assert (fleet.moves, truck.busy, truck.load) == ([], False, 0)
+    assert len(sim.ride_priority_queue) == 0
+    sim.run(start, end)
+    assert fleet.moves == moves
+
+    dataset = SweepDataset('stations.json', 'sample_rides.csv', start, end,
+                           track=True)
+    stations = dataset.simulation.all_stations
+    fleet = RebalancingFleet(dataset.simulation,
+                             [Truck('T1', 10, stations['6001'])])
+    dataset.evaluate({})
+    assert fleet.moves
+
+
+def test_stochastic_replications(tmp_path):
+    """Test that sampled rides follow the historical demand, and that
+    replications are reproducible whatever the number of processes.
+    """
+    history = str(tmp_path / 'history.csv')
+    generate_rides(history, 2000, 2)
+    model = DemandModel('stations.json', [history])
+    assert abs(sum(model.rates.values()) - 1000) < 1e-6
+    assert sum(cumulative[-1]
+               for _, cumulative in model.durations.values()) == 2000
+    assert model.pair_durations
+
+    # Rides between two stations with enough history keep their durations
+    stations = create_stations('stations.json')
+    index = {stations[station_id]: position
+             for position, station_id in enumerate(model.station_ids)}
+    rides = model.sample(stations, datetime(2017, 4, 15),
+                         datetime(2017, 4, 22), random.Random(1))
+    paired = 0
+    for ride in rides:
+        pair = (index[ride.start], index[ride.end])
+        if pair in model.pair_durations:
+            paired += 1
+            assert ride.end_minute - ride.start_minute in \
+                [max(1, value) for value in model.pair_durations[pair][0]]
+    assert paired
+
+    start = datetime(2017, 4, 15, 7, 0)
+    end = datetime(2017, 4, 15, 10, 0)
+    serial = replicate(model, 'stations.json', start, end, 4, seed=3,
+                       processes=1)
+    parallel = replicate(model, 'stations.json', start, end, 4, seed=3,
+                         processes=2)
+    assert serial == parallel
+    for summary in serial.values():
+        assert summary['p5'] <= summary['p50'] <= summary['p95']
+        assert 1 <= summary['station'][1] <= 4
+
+
+def test_station_refresh(tmp_path, monkeypatch):
+    """Test that a new snapshot updates changed stations in place, keeping
+    the active rides and the statistics of the simulation.
+    """
+    monkeypatch.setattr(refresh, 'CHUNK_SIZE', 7)
+    with open('stations.json') as file:
+        raw = json.load(file)
+    assert list(refresh.iter_raw_stations('stations.json')) == \
+        raw['stations']
+
+    sim = Simulation('stations.json', 'sample_rides.csv', visualize=False)
+    sim.run(datetime(2017, 6, 1, 8, 0), datetime(2017, 6, 1, 9, 0))
+    station = sim.all_stations['6001']
+    active = dict(sim.active_rides)
+    starts = station.num_bikes_start
+
+    refresher = refresh.StationRefresher(sim)
+    assert refresher.refresh('stations.json').updated == []
+    raw['stations'][0]['da'] += 1
+    raw['stations'][0]['lu'] += 1
+    raw['stations'][1]['s'] = 'Renamed'
+    added = dict(raw['stations'][2], n='9999')
+    raw['stations'] = raw['stations'][:3] + [added]
+    snapshot = tmp_path / 'snapshot.json'
+    snapshot.write_text(json.dumps(raw))
+
+    changes = refresher.refresh(str(snapshot))
+    assert changes.updated == ['6001']
+    assert changes.added == ['9999']
+    assert changes.skipped == 2
+    assert len(changes.missing) == len(sim.all_stations) - 4
+    assert sim.all_stations['6001'] is station
+    assert sim.active_rides == active
+    assert station.num_bikes_start == starts
+    assert station.num_bikes == raw['stations'][0]['da']
+
+    # A change of capacity alone is a change of occupancy
+    notified = []
+    sim.add_occupancy_listener(notified.append)
+    raw['stations'][0]['ba'] += 2
+    raw['stations'][0]['lu'] += 1
+    snapshot.write_text(json.dumps(raw))
+    assert refresher.refresh(str(snapshot)).updated == ['6001']
+    assert notified == [station]
+    assert station.capacity == raw['stations'][0]['ba'] + station.num_bikes
+
+
+def test_sharded_rides(tmp_path, monkeypatch):
+    """Test that rides loaded from a sharded dataset match the rides loaded
+    from the original file, and that the manifest prunes row groups.
+    """
+    stations = create_stations('stations.json')
+    directory = str(tmp_path / 'shards')
+    write_shards(['sample_rides.csv'], directory)
+    manifest = read_manifest(directory)
+    assert list(manifest['days']) == ['2017-06-01']
+
+    start = datetime(2017, 6, 1, 8, 0)
+    end = datetime(2017, 6, 1, 9, 0)
+    expected = [(ride.start, ride.end, ride.start_time, ride.end_time)
+                for ride in create_rides('sample_rides.csv', stations)
+                if start <= ride.start_time <= end]
+    assert [(ride.start, ride.end, ride.start_time, ride.end_time)
+            for ride in load_rides(directory, stations, start, end)] == \
+        expected
+
+    groups = select_groups(manifest, start, end, ['6200', 'missing'])
+    assert [group[1] for group in groups] == ['6200']
+    assert select_groups(manifest, datetime(2017, 6, 2),
+                         datetime(2017, 6, 3)) == []
+    assert [ride.start for ride in load_rides(directory, stations, start,
+                                              end, ['6200'])] == \
+        [stations['6200']]
+
+    # Quoted fields survive, and rows are spilled across days
+    monkeypatch.setattr(shards, 'SPILL_ROWS', 2)
+    rows = [['2017-06-0{} 08:0{}'.format(day, minute), '6200',
+             '2017-06-0{} 09:00'.format(day), '6015', '1,2', 'a "b"']
+            for minute in range(3) for day in (1, 2)]
+    quoted = tmp_path / 'quoted.csv'
+    with open(str(quoted), 'w', newline='') as file:
+        csv.writer(file).writerows(rows)
+    write_shards([str(quoted)], directory)
+    assert list(shards.iter_rows(directory, datetime(2017, 6, 1),
+                                 datetime(2017, 6, 3))) == rows
+
+    # Dates that are not zero-padded go in the shard of their day
+    unpadded = tmp_path / 'unpadded.csv'
+    unpadded.write_text('2017-6-1 8:05,6200,2017-6-1 8:30,6015\n')
+    write_shards([str(unpadded)], directory)
+    assert list(read_manifest(directory)['days']) == ['2017-06-01']
+    assert len(load_rides(directory, stations, datetime(2017, 6, 1),
+                          datetime(2017, 6, 2))) == 1
+
+
+def test_occupancy_history(tmp_path):
+    """Test that the occupancy at past instants is restored from snapshots
+    and the change log as it was during the run.
+    """
+    rides_file = str(tmp_path / 'rides.csv')
+    generate_rides(rides_file, 2000, 1)
+    sim = Simulation('stations.json', rides_file, visualize=False)
+    sim.enable_occupancy_tracking()
+    initial = {_id: station.num_bikes
+               for _id, station in sim.all_stations.items()}
+    history = OccupancyHistory(sim, interval=10)
+    log = []
+    sim.add_occupancy_listener(lambda station: log.append(
+        (sim.current_minute, station.name, station.num_bikes)))
+    sim.run(datetime(2017, 4, 15, 7, 0), datetime(2017, 4, 15, 10, 0))
+    assert history.changes() == len(log) > 0
+
+    names = {station.name: _id for _id, station in sim.all_stations.items()}
+    for time in [datetime(2017, 4, 15, 6, 0), datetime(2017, 4, 15, 8, 37),
+                 datetime(2017, 4, 15, 9, 0, 30), datetime(2017, 4, 16)]:
+        expected = dict(initial)
+        for minute, name, bikes in log:
+            if minute <= to_minutes(time):
+                expected[names[name]] = bikes
+        assert history.state_at(time) == expected
+
+
+def test_trajectory_export(tmp_path):
+    """Test that batched positions match Ride.get_position, and that every
+    export format writes all of them.
+    """
+    stations = create_stations('stations.json')
+    rides = create_rides('sample_rides.csv', stations)
+    start = datetime(2017, 6, 1, 8, 0)
+    end = datetime(2017, 6, 1, 9, 0, 5)
+    chunks = list(iter_chunks(rides, start, end, step=25, chunk_rows=50))
+    assert len(chunks) > 1
+    rows = 0
+    for chunk in chunks:
+        rows += len(chunk)
+        for number, seconds, x, y in zip(chunk.rides, chunk.times,
+                                         chunk.longitudes, chunk.latitudes):
+            time = datetime(1970, 1, 1) + timedelta(seconds=seconds)
+            assert start <= time <= end
+            assert rides[number].start_time <= time <= \
+                rides[number].end_time
+            assert rides[number].get_position(time) == (x, y)
+
+    path = str(tmp_path / 'positions.bin')
+    assert export_trajectories(rides, path, start, end, 25, 'columnar',
+                               50) == rows
+    loaded = list(read_columnar(path))
+    assert [list(chunk.latitudes) for chunk in loaded] == \
+        [list(chunk.latitudes) for chunk in chunks]
+
+    path = str(tmp_path / 'positions.csv')
+    assert export_trajectories(rides, path, start, end, 25) == rows
+    with open(path) as file:
+        assert len(file.readlines()) == rows + 1
+    path = str(tmp_path / 'positions.geojsonl')
+    assert export_trajectories(rides, path, start, end, 25,
+                               'geojsonl') == rows
+    with open(path) as file:
+        lines = [json.loads(line) for line in file]
+    assert sum(len(line['properties']['times']) for line in lines) == rows
+    assert len(lines) == len({number for chunk in chunks
+                              for number in chunk.rides})
+
+    # A ride that ends in the minute it starts stays at its start station,
+    # and its single position is written as a Point
+    still = Ride(stations['6200'], stations['6015'], (start, start))
+    chunk, = iter_chunks([still], start, end, step=25)
+    assert list(chunk.longitudes) == [stations['6200'].location[0]]
+    path = str(tmp_path / 'still.geojsonl')
+    assert export_trajectories([still], path, start, end, 25,
+                               'geojsonl') == 1
+    with open(path) as file:
+        assert json.load(file)['geometry'] == {
+            'type': 'Point', 'coordinates': list(stations['6200'].location)}
+
+
+def test_station_recorder(tmp_path):
+    """Test per-minute and per-change recording, including a full ring
+    buffer and the CSV export.
+    """
+    rides_file = str(tmp_path / 'rides.csv')
+    generate_rides(rides_file, 2000, 1)
+    sim = Simulation('stations.json', rides_file, visualize=False)
+    sim.enable_occupancy_tracking()
+    width = len(sim.all_stations)
+    minutes = StationRecorder(sim, budget=30 * (8 + 2 * width))
+    changes = StationRecorder(sim, PER_CHANGE)
+    history = OccupancyHistory(sim)
+    sim.run(datetime(2017, 4, 15, 7, 0), datetime(2017, 4, 15, 9, 0))
+
+    assert minutes.capacity == len(minutes) == 30
+    assert minutes.dropped == 90
+    first = to_minutes(datetime(2017, 4, 15, 8, 31))
+    assert [minute for minute, _ in minutes.series('6001')] == \
+        list(range(first, first + 30))
+    state = history.state_at(datetime(2017, 4, 15, 8, 45))
+    assert {station_id: bikes for minute, station_id, bikes
+            in minutes.records()
+            if minute == first + 14} == state
+
+    assert changes.dropped == 0 and len(changes) == history.changes()
+    path = str(tmp_path / 'changes.csv')
+    assert changes.to_csv(path) == len(changes)
+
+
+def test_parallel_loader(tmp_path, monkeypatch):
+    """Test that the parallel loader returns exactly the rides of
+    create_rides, in file order or sorted by start time.
+    """
+    monkeypatch.setattr(loader, 'MIN_PARALLEL_BYTES', 0)
+    rides_file = str(tmp_path / 'rides.csv')
+    generate_rides(rides_file, 3000, 2)
+    with open(rides_file) as file:
+        size = len(file.read())
+    ranges = loader.split_ranges(rides_file, 7)
+    assert ranges[0][0] == 0 and ranges[-1][1] == size
+    assert all(end == start for (_, end), (start, _)
+               in zip(ranges, ranges[1:]))
+
+    stations = create_stations('stations.json')
+    # Shuffle the order of the lines, so that sorting changes it
+    with open(rides_file) as file:
+        lines = file.readlines()
+    # A field with a character that str.splitlines treats as a line break
+    lines.append(lines[0].rstrip('\n') + '\x1c\n')
+    with open(rides_file, 'w') as file:
+        file.writelines(lines[1::2] + lines[::2])
+    expected = create_rides(rides_file, stations)
+
+    def key(ride):
+        return ride.start, ride.end, ride.start_minute, ride.end_minute
+    for sort in [False, True]:
+        rides = loader.load_rides(rides_file, stations, 3, sort)
+        ordered = sorted(expected, key=lambda ride: ride.start_minute) \
+            if sort else expected
+        assert list(map(key, rides)) == list(map(key, ordered))
+
+
+def test_engines_agree(tmp_path, monkeypatch):
+    """Test that every engine agrees with the reference, with and without
+    occupancy tracking, and that a disagreement is caught.
+    """
+    rides_file = str(tmp_path / 'rides.csv')
+    generate_rides(rides_file, 1500, 1)
+    start = datetime(2017, 4, 15, 6, 59, 30)
+    end = datetime(2017, 4, 15, 11, 0, 15)
+    for track in [False, True]:
+        results = differential.compare_engines('stations.json', rides_file,
+                                               start, end, track=track)
+        assert set(results) == set(differential.ENGINES)
+        assert len(results['queue'].trace) == 241
+
+    def broken(sim, run_start, run_end, observe):
+        differential.run_scan(sim, run_start, run_end, observe)
+        sim.all_stations['6001'].num_bikes_start += 100
+    monkeypatch.setitem(differential.ENGINES, 'broken', broken)
+    with pytest.raises(AssertionError):
+        differential.compare_engines('stations.json', rides_file, start,
+                                     end, ['queue', 'broken'])
+
+
+def test_trip_sketches(tmp_path):
+    """Test the per-station trip quantiles against the exact values, and
+    the merging of sketches from separate runs.
+    """
+    rides_file = str(tmp_path / 'rides.csv')
+    generate_rides(rides_file, 3000, 1)
+    windows = [(datetime(2017, 4, 15), datetime(2017, 4, 15, 12)),
+               (datetime(2017, 4, 15, 12), datetime(2017, 4, 16))]
+    runs = []
+    for start, end in windows:
+        sim = Simulation('stations.json', rides_file, visualize=False)
+        sim.enable_trip_statistics(k=16)
+        sim.run(start, end)
+        runs.append(sim)
+    first, second = runs
+    first.trip_sketches.merge(second.trip_sketches)
+    summary = first.calculate_trip_statistics()
+    for name, station in summary.items():
+        # The trips that started and ended within one of the runs
+        durations = sorted(ride.end_minute - ride.start_minute
+                           for ride in first.all_rides
+                           for start, end in windows
+                           if ride.start.name == name and
+                           start < ride.start_time < end and
+                           ride.end_time <= end)
+        assert station['trips'] == len(durations)
+        if len(durations) < 10:
+            assert station['duration'][0] == \
+                durations[(len(durations) - 1) // 2]
+
+    # Enabling the statistics again replaces the sketches, and the trips
+    # are still counted once
+    sim = Simulation('stations.json', rides_file, visualize=False)
+    sim.enable_trip_statistics(k=16)
+    old = sim.trip_sketches
+    sim.enable_trip_statistics(k=16)
+    start, end = windows[0]
+    sim.run(start, end)
+    assert old.durations == {}
+    assert sum(station['trips'] for station in
+               sim.calculate_trip_statistics().values()) == \
+        sum(1 for ride in sim.all_rides
+            if start < ride.start_time < end and ride.end_time <= end)
+
+    sketch = KLLSketch(k=16)
+    for value in range(10000):
+        sketch.add(value)
+    assert len(sketch) < 100
+    assert abs(sketch.quantile(0.95) - 9500) < 1000
+
+
+def test_frame_producer_never_blocks(monkeypatch):
+    """Test that the simulation drops frames instead of waiting for a full
+    queue, without building them, and that frames hold the positions of
+    the active rides.
+    """
+    built = []
+    monkeypatch.setattr(viewer, 'Frame',
+                        lambda *args: built.append(args) or Frame(*args))
+    sim = Simulation('stations.json', 'sample_rides.csv', visualize=False)
+    frames = queue.Queue(5)
+    producer = FrameProducer(sim, frames)
+    sim.run(datetime(2017, 6, 1, 8, 0), datetime(2017, 6, 1, 9, 0))
+    assert (producer.sent, producer.dropped) == (5, 55)
+    assert len(built) == 5
+
+    frame = frames.get_nowait()
+    assert frame.minute == to_minutes(datetime(2017, 6, 1, 8, 1))
+    rides = [ride for ride in sim.all_rides
+             if ride.start_minute <= frame.minute < ride.end_minute and
+             ride.start_time > datetime(2017, 6, 1, 8, 0)]
+    assert [marker.position for marker in frame.markers()] == \
+        [ride.get_position(datetime(2017, 6, 1, 8, 1)) for ride in rides]
+
+
+def test_playback_history():
+    """Test receiving frames from a producer thread, and pausing, scrubbing
+    and replaying the history.
+    """
+    frames, worker, _ = start_producer(
+        'stations.json', 'sample_rides.csv', datetime(2017, 6, 1, 8, 0),
+        datetime(2017, 6, 1, 9, 0), use_process=False)
+    playback = Playback(history=40)
+    received = 0
+    while not playback.finished:
+        received += playback.receive(frames)
+    worker.join()
+    assert received == 60 and len(playback.frames) == 40
+    newest = playback.current().minute
+
+    playback.toggle_pause()
+    playback.scrub(-3)
+    assert playback.current().minute == newest - 3
+    playback.scrub(-100)
+    assert playback.current() is playback.frames[0]
+    playback.toggle_pause()
+    for _ in range(38):
+        playback.advance()
+    assert playback.position == 38
+    playback.advance()
+    assert playback.position is None
+    assert playback.current().minute == newest
+
+
+def test_headless_startup():
+    """Test that a headless simulation starts without loading the graphics
+    modules, and within the startup budget.
+    """
+    startup = time_startup()
+    assert not startup['graphics_loaded']
+    assert startup['total'] <= STARTUP_BUDGET
+
+
+if __name__ == '__main__':
+    pytest.main(['a1_test_engine.py'])
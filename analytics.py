@@ -0,0 +1,256 @@
+"""Assignment 1 - Demand analytics
+
+=== Module Description ===
+
+This file contains the ODMatrix class, which counts rides between every
+pair of stations (an origin-destination, or OD, matrix) in each time bucket,
+for example each hour.
+
+Rides are streamed from the ride files with read_ride_records, so no Ride
+objects are ever created and memory only grows with the number of distinct
+(bucket, origin, destination) combinations. Counts are stored per bucket,
+so reading one bucket does not depend on the size of the whole matrix.
+Matrices built from different files can be merged, and aggregate_files
+builds the matrices of several files in parallel before merging them.
+
+Matrices are saved in a compact binary form: a small JSON header followed
+by the zlib-compressed keys and counts of the non-zero cells.
+"""
+from array import array
+from datetime import datetime
+import json
+from multiprocessing import Pool
+import struct
+import sys
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bikeshare import from_minutes, to_minutes
+from simulation import create_stations, read_ride_records, station_index
+
+# Identifies the files written by ODMatrix.save
+MAGIC = b'ODM1'
+
+
+class ODMatrix:
+    """Sparse counts of rides per time bucket, origin and destination.
+
+    === Attributes ===
+    station_ids:
+        the ids of the stations, in the order of their dense index
+    bucket_minutes:
+        the length of each time bucket, in minutes. Bucket b covers the
+        rides starting from b * bucket_minutes minutes after EPOCH.
+    counts:
+        for each bucket with at least one ride, the number of rides of each
+        non-zero (origin, destination) pair, keyed by the pair number
+        origin * len(station_ids) + destination
+
+    === Representation Invariants ===
+    - every value in counts is a non-empty dictionary of positive counts
+    """
+    station_ids: List[str]
+    bucket_minutes: int
+    counts: Dict[int, Dict[int, int]]
+
+    # === Private attributes ===
+    # _index: the dense index of each station, keyed by station id.
+    _index: Dict[str, int]
+
+    def __init__(self, station_ids: List[str], bucket_minutes: int = 60) \
+            -> None:
+        """Initialize an empty matrix over the given stations.
+        """
+        self.station_ids = list(station_ids)
+        self.bucket_minutes = bucket_minutes
+        self.counts = {}
+        self._index = {_id: index
+                       for index, _id in enumerate(self.station_ids)}
+
+    def cell(self, bucket: int, origin: int, destination: int) -> int:
+        """Return the packed cell number of the given bucket, origin and
+        destination.
+
+        >>> ODMatrix(['a', 'b', 'c']).cell(2, 1, 0)
+        21
+        """
+        size = len(self.station_ids)
+        return (bucket * size + origin) * size + destination
+
+    def unpack(self, cell: int) -> Tuple[int, int, int]:
+        """Return the (bucket, origin, destination) of a packed cell number.
+
+        >>> ODMatrix(['a', 'b', 'c']).unpack(21)
+        (2, 1, 0)
+        """
+        size = len(self.station_ids)
+        rest, destination = divmod(cell, size)
+        bucket, origin = divmod(rest, size)
+        return bucket, origin, destination
+
+    def add_records(self, records: Iterable[Tuple[int, int, int, int]]) \
+            -> None:
+        """Count each ride in <records>, given as the tuples yielded by
+        read_ride_records, in the bucket of its start time.
+        """
+        counts = self.counts
+        size = len(self.station_ids)
+        bucket_minutes = self.bucket_minutes
+        for start_time, origin, _, destination in records:
+            bucket = start_time // bucket_minutes
+            pairs = counts.get(bucket)
+            if pairs is None:
+                pairs = counts[bucket] = {}
+            pair = origin * size + destination
+            pairs[pair] = pairs.get(pair, 0) + 1
+
+    def merge(self, other: 'ODMatrix') -> None:
+        """Add all the counts of <other> to this matrix.
+
+        Raise a ValueError if <other> is over different stations or uses
+        different buckets.
+        """
+        if other.station_ids != self.station_ids or \
+                other.bucket_minutes != self.bucket_minutes:
+            raise ValueError('cannot merge matrices over different stations '
+                             'or buckets')
+        for bucket, theirs in other.counts.items():
+            pairs = self.counts.setdefault(bucket, {})
+            for pair, count in theirs.items():
+                pairs[pair] = pairs.get(pair, 0) + count
+
+    def count(self, bucket: int, origin: str, destination: str) -> int:
+        """Return the number of rides from station id <origin> to station id
+        <destination> that started in <bucket>.
+        """
+        pairs = self.counts.get(bucket)
+        if pairs is None:
+            return 0
+        return pairs.get(self._index[origin] * len(self.station_ids) +
+                         self._index[destination], 0)
+
+    def bucket_of(self, time: datetime) -> int:
+        """Return the bucket that contains <time>."""
+        return to_minutes(time) // self.bucket_minutes
+
+    def bucket_start(self, bucket: int) -> datetime:
+        """Return the time at which <bucket> starts."""
+        return from_minutes(bucket * self.bucket_minutes)
+
+    def buckets(self) -> List[int]:
+        """Return the buckets with at least one ride, in increasing order.
+        """
+        return sorted(self.counts)
+
+    def flows(self, bucket: int) -> Dict[Tuple[str, str], int]:
+        """Return the non-zero counts of <bucket>, keyed by (origin id,
+        destination id).
+        """
+        size = len(self.station_ids)
+        ids = self.station_ids
+        flows = {}
+        for pair, count in self.counts.get(bucket, {}).items():
+            origin, destination = divmod(pair, size)
+            flows[(ids[origin], ids[destination])] = count
+        return flows
+
+    def total(self) -> int:
+        """Return the total number of rides counted in this matrix."""
+        return sum(sum(pairs.values()) for pairs in self.counts.values())
+
+    def save(self, path: str) -> None:
+        """Write this matrix to <path> in its compact binary form.
+
+        The cells are stored by packed cell number (see cell), in increasing
+        order, as little-endian 64-bit integers.
+        """
+        square = len(self.station_ids) ** 2
+        keys = array('q')
+        values = array('q')
+        for bucket in sorted(self.counts):
+            pairs = self.counts[bucket]
+            for pair in sorted(pairs):
+                keys.append(bucket * square + pair)
+                values.append(pairs[pair])
+        if sys.byteorder == 'big':
+            keys.byteswap()
+            values.byteswap()
+        header = json.dumps({'station_ids': self.station_ids,
+                             'bucket_minutes': self.bucket_minutes,
+                             'cells': len(keys)}).encode()
+        body = zlib.compress(keys.tobytes() + values.tobytes())
+        with open(path, 'wb') as file:
+            file.write(MAGIC)
+            file.write(struct.pack('<I', len(header)))
+            file.write(header)
+            file.write(body)
+
+    @classmethod
+    def load(cls, path: str) -> 'ODMatrix':
+        """Return the matrix saved in <path> by save.
+
+        Raise a ValueError if <path> is not such a file.
+        """
+        with open(path, 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError('{} is not an OD matrix file'.format(path))
+            header_size, = struct.unpack('<I', file.read(4))
+            header = json.loads(file.read(header_size).decode())
+            body = zlib.decompress(file.read())
+
+        matrix = cls(header['station_ids'], header['bucket_minutes'])
+        keys = array('q')
+        values = array('q')
+        split = header['cells'] * keys.itemsize
+        keys.frombytes(body[:split])
+        values.frombytes(body[split:])
+        if sys.byteorder == 'big':
+            keys.byteswap()
+            values.byteswap()
+        square = len(matrix.station_ids) ** 2
+        for cell, count in zip(keys, values):
+            bucket, pair = divmod(cell, square)
+            matrix.counts.setdefault(bucket, {})[pair] = count
+        return matrix
+
+
+def aggregate_file(stations_file: str, rides_file: str,
+                   bucket_minutes: int = 60) -> ODMatrix:
+    """Return the OD matrix of the rides in <rides_file>."""
+    index = station_index(create_stations(stations_file))
+    matrix = ODMatrix(list(index), bucket_minutes)
+    matrix.add_records(read_ride_records(rides_file, index))
+    return matrix
+
+
+def _aggregate_job(job: Tuple[str, str, int]) -> ODMatrix:
+    """Return the OD matrix for one (stations file, rides file, bucket
+    length) job. Used by the worker processes of aggregate_files.
+    """
+    return aggregate_file(*job)
+
+
+def aggregate_files(stations_file: str, rides_files: List[str],
+                    bucket_minutes: int = 60,
+                    processes: Optional[int] = None) -> ODMatrix:
+    """Return the OD matrix of the rides in all of <rides_files>.
+
+    Each file is aggregated separately in a pool of <processes> worker
+    processes (by default, one per CPU), and the partial matrices are then
+    merged. With processes=1, everything runs in this process.
+    """
+    jobs = [(stations_file, rides_file, bucket_minutes)
+            for rides_file in rides_files]
+    if processes == 1 or len(jobs) <= 1:
+        partials = [_aggregate_job(job) for job in jobs]
+    else:
+        with Pool(processes) as pool:
+            partials = pool.map(_aggregate_job, jobs)
+
+    if not partials:
+        index = station_index(create_stations(stations_file))
+        return ODMatrix(list(index), bucket_minutes)
+    matrix = partials[0]
+    for partial in partials[1:]:
+        matrix.merge(partial)
+    return matrix
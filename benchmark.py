@@ -0,0 +1,306 @@
+"""Assignment 1 - Benchmarks
+
+=== Module Description ===
+
+This file contains a deterministic generator of synthetic Bixi-scale ride
+files, and a small harness that times the three phases of a simulation
+(loading the data, running it, and calculating the statistics).
+
+Rides are generated over the real stations in stations.json. Start times
+follow a weekday commute pattern, with a morning and an evening peak on top
+of a flat background, and durations are derived from the distance between
+the two stations. The same seed always produces the same file.
+
+It also measures how long a headless simulation takes to start, that is to
+import the simulation module and construct a Simulation on the sample data,
+and checks it against STARTUP_BUDGET.
+
+Results are written as JSON so that runs on different commits can be
+compared with the --compare option:
+
+    python benchmark.py --sizes 10k 1m --output before.json
+    python benchmark.py --sizes 10k 1m --output after.json --compare before.json
+"""
+import argparse
+import bisect
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from bikeshare import distance
+
+# Presets: number of rides and number of days they are spread over
+SIZES = {
+    '10k': (10000, 1),
+    '1m': (1000000, 30),
+    '10m': (10000000, 214),
+}
+
+# First day of the generated rides (the Bixi season opens mid-April)
+FIRST_DAY = datetime(2017, 4, 15)
+
+# Directory in which generated ride files are cached
+DATA_DIR = 'bench_data'
+
+# Commute peaks, as (centre in minutes after midnight, spread in minutes,
+# share of the day's rides). The remaining share is spread over the day.
+PEAKS = [(8 * 60 + 15, 50, 0.3), (17 * 60 + 15, 70, 0.35)]
+
+# Average riding speed in km/h, used to derive ride durations
+RIDING_SPEED = 14.0
+
+# Rides are never shorter or longer than these, in minutes
+MIN_DURATION = 2
+MAX_DURATION = 150
+
+# A line of a ride file: start time, start station, end time, end station,
+# duration in seconds and whether the rider is a member
+RIDE_LINE = '{:%Y-%m-%d %H:%M},{},{:%Y-%m-%d %H:%M},{},{},{}\n'
+
+# Maximum time in seconds for importing the simulation module and
+# constructing a headless Simulation on the sample data
+STARTUP_BUDGET = 0.5
+
+# Script run in a fresh interpreter to measure startup, printing the import
+# and construction times as JSON
+_STARTUP_SCRIPT = '''
+import json, sys, time
+before = time.perf_counter()
+from simulation import Simulation
+imported = time.perf_counter()
+Simulation(sys.argv[1], sys.argv[2], visualize=False)
+constructed = time.perf_counter()
+print(json.dumps({'import': imported - before,
+                  'construct': constructed - imported,
+                  'graphics_loaded': 'visualizer' in sys.modules}))
+'''
+
+
+def _load_station_locations(stations_file: str) \
+        -> List[Tuple[str, Tuple[float, float]]]:
+    """Return the (id, (long, lat)) pairs of the stations in <stations_file>.
+    """
+    with open(stations_file) as file:
+        raw_stations = json.load(file)
+    return [(s['n'], (float(s['lo']), float(s['la'])))
+            for s in raw_stations['stations']]
+
+
+def _start_minute(rng: random.Random) -> int:
+    """Return a random start minute within a day, following the commute
+    pattern described by PEAKS.
+    """
+    pick = rng.random()
+    for centre, spread, share in PEAKS:
+        if pick < share:
+            minute = int(rng.gauss(centre, spread))
+            return min(max(minute, 0), 24 * 60 - 1)
+        pick -= share
+    # Background demand, mostly during the day
+    return min(int(rng.triangular(5 * 60, 24 * 60, 14 * 60)), 24 * 60 - 1)
+
+
+def generate_rides(path: str, num_rides: int, num_days: int,
+                   stations_file: str = 'stations.json',
+                   seed: int = 148) -> None:
+    """Write <num_rides> synthetic rides over <num_days> days to <path>.
+
+    The file follows the format of sample_rides.csv and is sorted by start
+    time. Each station gets a fixed popularity, so some stations are much
+    busier than others, and the output only depends on the arguments.
+    """
+    rng = random.Random(seed)
+    stations = _load_station_locations(stations_file)
+    ids = [station_id for station_id, _ in stations]
+    locations = [location for _, location in stations]
+
+    # Zipf-like popularity, assigned to stations in a random order
+    order = list(range(len(stations)))
+    rng.shuffle(order)
+    weights = [0.0] * len(stations)
+    for rank, index in enumerate(order):
+        weights[index] = 1 / (rank + 1) ** 0.8
+    cumulative = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+
+    def pick_station() -> int:
+        """Return the index of a random station, weighted by popularity."""
+        return bisect.bisect(cumulative, rng.random() * total)
+
+    # Rides per day, with the remainder spread over the first days
+    per_day = [num_rides // num_days + (1 if day < num_rides % num_days
+                                        else 0)
+               for day in range(num_days)]
+
+    with open(path, 'w') as file:
+        for day, count in enumerate(per_day):
+            date = FIRST_DAY + timedelta(days=day)
+            starts = sorted(_start_minute(rng) for _ in range(count))
+            lines = []
+            for start in starts:
+                origin = pick_station()
+                destination = pick_station()
+                length = distance(locations[origin], locations[destination])
+                duration = length / RIDING_SPEED * 60 * rng.uniform(0.8, 1.6)
+                duration = min(max(int(duration) + 1, MIN_DURATION),
+                               MAX_DURATION)
+                start_time = date + timedelta(minutes=start)
+                end_time = start_time + timedelta(minutes=duration)
+                lines.append(RIDE_LINE.format(
+                    start_time, ids[origin], end_time, ids[destination],
+                    duration * 60, 1 if rng.random() < 0.8 else 0))
+            file.writelines(lines)
+
+
+def ride_file_for(size: str, stations_file: str = 'stations.json',
+                  seed: int = 148) -> str:
+    """Return the path of the ride file for the preset <size>, generating
+    it first if it does not exist yet.
+    """
+    num_rides, num_days = SIZES[size]
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, 'rides_{}_{}.csv'.format(size, seed))
+    if not os.path.exists(path):
+        generate_rides(path, num_rides, num_days, stations_file, seed)
+    return path
+
+
+def time_simulation(stations_file: str, rides_file: str,
+                    start: datetime, end: datetime) -> Dict[str, float]:
+    """Run one simulation from <start> to <end> and return the wall time of
+    each of its phases, in seconds.
+    """
+    # Imported here so that generating data does not need the simulation
+    from simulation import Simulation
+
+    timings = {}
+    before = time.perf_counter()
+    sim = Simulation(stations_file, rides_file, visualize=False)
+    timings['load'] = time.perf_counter() - before
+
+    before = time.perf_counter()
+    sim.run(start, end)
+    timings['run'] = time.perf_counter() - before
+
+    before = time.perf_counter()
+    sim.calculate_statistics()
+    timings['statistics'] = time.perf_counter() - before
+    return timings
+
+
+def time_startup(stations_file: str = 'stations.json',
+                 rides_file: str = 'sample_rides.csv') -> Dict[str, Any]:
+    """Return the time taken to import the simulation module and construct
+    a headless Simulation, measured in a fresh interpreter.
+
+    The result also records whether the graphics modules were loaded, and
+    whether the total is within STARTUP_BUDGET.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run([sys.executable, '-c', _STARTUP_SCRIPT,
+                             stations_file, rides_file],
+                            stdout=subprocess.PIPE, cwd=here,
+                            check=True).stdout.decode()
+    startup = json.loads(output.splitlines()[-1])
+    startup['total'] = startup['import'] + startup['construct']
+    startup['within_budget'] = startup['total'] <= STARTUP_BUDGET
+    return startup
+
+
+def _git_commit() -> str:
+    """Return the commit the working tree is on, or '' if it is unknown."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL,
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run_benchmarks(sizes: List[str], stations_file: str = 'stations.json',
+                   seed: int = 148) -> Dict:
+    """Benchmark each preset in <sizes> and return the results.
+
+    Each simulation runs over the whole period covered by its rides.
+    """
+    results = []
+    for size in sizes:
+        num_rides, num_days = SIZES[size]
+        rides_file = ride_file_for(size, stations_file, seed)
+        timings = time_simulation(stations_file, rides_file, FIRST_DAY,
+                                  FIRST_DAY + timedelta(days=num_days))
+        results.append({'size': size, 'rides': num_rides, 'days': num_days,
+                        'timings': timings})
+    return {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'seed': seed,
+        'startup': time_startup(stations_file),
+        'results': results,
+    }
+
+
+def compare(old: Dict, new: Dict) -> List[str]:
+    """Return one line per size and phase comparing <new> results to <old>.
+
+    Sizes that only appear in one of the two results are skipped.
+    """
+    old_results = {result['size']: result for result in old['results']}
+    lines = []
+    if 'startup' in old and 'startup' in new:
+        lines.append('     {:<12} {:10.4f}s -> {:10.4f}s'.format(
+            'startup', old['startup']['total'], new['startup']['total']))
+    for result in new['results']:
+        if result['size'] not in old_results:
+            continue
+        old_timings = old_results[result['size']]['timings']
+        for phase, seconds in result['timings'].items():
+            if phase not in old_timings:
+                continue
+            before = old_timings[phase]
+            ratio = seconds / before if before else float('inf')
+            lines.append('{:>4} {:<12} {:10.4f}s -> {:10.4f}s  x{:.2f}'
+                         .format(result['size'], phase, before, seconds,
+                                 ratio))
+    return lines
+
+
+def main(argv: List[str]) -> None:
+    """Run the benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', choices=sorted(SIZES),
+                        default=['10k'])
+    parser.add_argument('--stations', default='stations.json')
+    parser.add_argument('--seed', type=int, default=148)
+    parser.add_argument('--output', help='file to write the JSON results to')
+    parser.add_argument('--compare', help='earlier JSON results to compare to')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.stations, args.seed)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            print('\n'.join(compare(json.load(file), results)))
+    if not results['startup']['within_budget']:
+        print('Startup took {:.3f}s, over the budget of {}s'.format(
+            results['startup']['total'], STARTUP_BUDGET))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -15,7 +15,8 @@ There is also an abstract Drawable class that is the superclass for both
 Station and Ride. It enables the simulation to visualize these objects in
 a graphical window.
 """
-from datetime import datetime
+from datetime import datetime, timedelta
+import math
 from typing import Tuple
 
 
@@ -23,6 +24,42 @@ from typing import Tuple
 STATION_SPRITE = 'stationsprite.png'
 RIDE_SPRITE = 'bikesprite.png'
 
+# The simulation engine represents times as whole minutes since EPOCH, and
+# only converts to datetime objects at the edges of its API.
+EPOCH = datetime(1970, 1, 1)
+MINUTE = timedelta(minutes=1)
+
+
+def to_minutes(time: datetime) -> int:
+    """Return <time> as a number of minutes since EPOCH, rounded down.
+
+    >>> to_minutes(datetime(1970, 1, 2, 0, 1, 30))
+    1441
+    """
+    return (time - EPOCH) // MINUTE
+
+
+def from_minutes(minutes: int) -> datetime:
+    """Return the datetime that is <minutes> minutes after EPOCH.
+
+    >>> from_minutes(1441)
+    datetime.datetime(1970, 1, 2, 0, 1)
+    """
+    return EPOCH + timedelta(minutes=minutes)
+
+
+def distance(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """Return the great-circle distance in km between two (long, lat)
+    positions.
+
+    >>> round(distance((-73.55, 45.5), (-73.55, 45.6)), 2)
+    11.12
+    """
+    lon1, lat1, lon2, lat2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
 
 class Drawable:
     """A base class for objects that the graphical renderer can be drawn.
@@ -31,6 +68,7 @@ class Drawable:
     sprite:
         The filename of the image to be drawn for this object.
     """
+    __slots__ = ('sprite',)
     sprite: str
 
     def __init__(self, sprite_file: str) -> None:
@@ -123,27 +161,68 @@ class Ride(Drawable):
         the station where this ride starts
     end:
         the station where this ride ends
+    start_minute:
+        the time this ride starts, in minutes since EPOCH
+    end_minute:
+        the time this ride ends, in minutes since EPOCH
     start_time:
-        the time this ride starts
+        the time this ride starts, as a datetime (stored in start_minute)
     end_time:
-        the time this ride ends
+        the time this ride ends, as a datetime (stored in end_minute)
 
     === Representation Invariants ===
-    - start_time < end_time
+    - start_minute < end_minute
     """
+    # Rides are created by the million, so they store their times as plain
+    # ints and have no instance dictionary.
+    __slots__ = ('start', 'end', 'start_minute', 'end_minute')
     start: Station
     end: Station
-    start_time: datetime
-    end_time: datetime
+    start_minute: int
+    end_minute: int
 
     def __init__(self, start: Station, end: Station,
                  times: Tuple[datetime, datetime]) -> None:
         """Initialize a ride object with the given start and end information.
         """
         self.start, self.end = start, end
-        self.start_time, self.end_time = times[0], times[1]
+        self.start_minute = to_minutes(times[0])
+        self.end_minute = to_minutes(times[1])
         Drawable.__init__(self, RIDE_SPRITE)
 
+    @classmethod
+    def from_minute_range(cls, start: Station, end: Station,
+                          minutes: Tuple[int, int]) -> 'Ride':
+        """Return a ride between <start> and <end> whose start and end times
+        are given in minutes since EPOCH.
+
+        This skips the conversion from datetime objects done by __init__.
+        """
+        ride = cls.__new__(cls)
+        ride.start, ride.end = start, end
+        ride.start_minute, ride.end_minute = minutes
+        ride.sprite = RIDE_SPRITE
+        return ride
+
+    @property
+    def start_time(self) -> datetime:
+        """Return the time this ride starts."""
+        return from_minutes(self.start_minute)
+
+    @start_time.setter
+    def start_time(self, time: datetime) -> None:
+        """Set the time this ride starts to <time>."""
+        self.start_minute = to_minutes(time)
+
+    @property
+    def end_time(self) -> datetime:
+        """Return the time this ride ends."""
+        return from_minutes(self.end_minute)
+
+    @end_time.setter
+    def end_time(self, time: datetime) -> None:
+        """Set the time this ride ends to <time>."""
+        self.end_minute = to_minutes(time)
 
     def get_position(self, time: datetime) -> Tuple[float, float]:
         """Return the position of this ride for the given time.
@@ -161,8 +240,8 @@ class Ride(Drawable):
                      self.start.get_position(time)[1]
 
         # Calculate what fraction of the trip has been done
-        fraction_traveled = (time - self.start_time).total_seconds() / (
-            self.end_time - self.start_time).total_seconds()
+        fraction_traveled = ((time - EPOCH) / MINUTE - self.start_minute) / (
+            self.end_minute - self.start_minute)
 
         # Calculate current position by adding start position and the distance
         # multiplied by the fraction of the trip that has been done at specified
@@ -0,0 +1,319 @@
+"""Assignment 1 - Result cache
+
+=== Module Description ===
+
+This file contains the ResultCache class, which caches the results of
+simulations keyed by the content of their input files and by their time
+window, so that repeated requests for the same statistics do not run the
+simulation again.
+
+The cache keeps the per-station counters of each run rather than only the
+four statistics, because they allow the result of a window to be composed
+from the results of contiguous sub-windows. This is only possible when no
+ride crosses the boundary between two sub-windows: that is, when no ride is
+still active at the end of the earlier one, and no ride starts exactly at
+the boundary (such a ride is not part of either sub-window, but is part of
+the whole window). The cache records both facts for every result, and only
+composes results when they hold.
+
+Results are evicted in least recently used order once their total size is
+over the byte budget. If a directory is given, every result is also written
+there, and results missing from memory are read back from it.
+"""
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Set, Tuple
+
+from bikeshare import from_minutes, to_minutes
+from simulation import Simulation, find_max
+
+# The station attributes kept for each result, and the statistic computed
+# from each of them
+COUNTERS = [('num_bikes_start', 'max_start'),
+            ('num_bikes_end', 'max_end'),
+            ('total_time_low_availability', 'max_time_low_availability'),
+            ('total_time_low_unoccupied', 'max_time_low_unoccupied')]
+
+# Approximate memory used by a result besides its counters, in bytes
+RESULT_OVERHEAD = 200
+
+
+class WindowResult:
+    """The result of a simulation over one time window.
+
+    === Attributes ===
+    counters:
+        the value of each attribute in COUNTERS for each station, one block
+        of len(stations) values per attribute, in the order of COUNTERS
+    active_at_end:
+        the number of rides still active at the end of the window
+    starts_at_end:
+        the number of rides starting exactly at the end of the window
+    """
+    counters: array
+    active_at_end: int
+    starts_at_end: int
+
+    def __init__(self, counters: array, active_at_end: int,
+                 starts_at_end: int) -> None:
+        """Initialize a new result."""
+        self.counters = counters
+        self.active_at_end = active_at_end
+        self.starts_at_end = starts_at_end
+
+    def closed(self) -> bool:
+        """Return whether no ride crosses the end of this window."""
+        return self.active_at_end == 0 and self.starts_at_end == 0
+
+    def nbytes(self) -> int:
+        """Return the approximate memory used by this result, in bytes."""
+        return RESULT_OVERHEAD + len(self.counters) * self.counters.itemsize
+
+    def then(self, other: 'WindowResult') -> 'WindowResult':
+        """Return the result of this window followed by the contiguous
+        window of <other>.
+
+        Precondition: self.closed()
+        """
+        counters = array('q', (a + b for a, b in zip(self.counters,
+                                                     other.counters)))
+        return WindowResult(counters, other.active_at_end,
+                            other.starts_at_end)
+
+
+class ResultCache:
+    """A bounded cache of simulation results.
+
+    === Attributes ===
+    max_bytes:
+        the memory budget for the results held in memory
+    directory:
+        the directory that results are persisted to, or None
+    hits:
+        the number of requests answered by a cached result
+    composed:
+        the number of requests answered by composing cached results
+    misses:
+        the number of requests that needed a new simulation
+    """
+    max_bytes: int
+    directory: Optional[str]
+    hits: int
+    composed: int
+    misses: int
+
+    # === Private attributes ===
+    # _results: the results in memory, keyed by (digest, start, end), in
+    #   least to most recently used order.
+    # _bytes: the total size of the results in memory.
+    # _ends: the ends of the windows with a cached result (in memory or on
+    #   disk), keyed by (digest, start).
+    # _names: the station names of each dataset, keyed by digest.
+    # _digests: the content digest of each file, keyed by its path, size
+    #   and modification time.
+    _results: 'OrderedDict[Tuple[str, datetime, datetime], WindowResult]'
+    _bytes: int
+    _ends: Dict[Tuple[str, datetime], Set[datetime]]
+    _names: Dict[str, List[str]]
+    _digests: Dict[Tuple[str, int, float], str]
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024,
+                 directory: Optional[str] = None) -> None:
+        """Initialize an empty cache.
+
+        If <directory> is given, results already persisted there can be
+        used by this cache.
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.hits = 0
+        self.composed = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._bytes = 0
+        self._ends = {}
+        self._names = {}
+        self._digests = {}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            for filename in os.listdir(directory):
+                if filename.endswith('.json'):
+                    digest, start, end = filename[:-len('.json')].split('_')
+                    self._ends.setdefault(
+                        (digest, from_minutes(int(start))),
+                        set()).add(from_minutes(int(end)))
+
+    def statistics(self, stations_file: str, rides_file: str,
+                   start: datetime, end: datetime) \
+            -> Dict[str, Tuple[str, float]]:
+        """Return the statistics of a simulation of the given files from
+        <start> to <end>, as returned by Simulation.calculate_statistics.
+        """
+        digest = self._digest(stations_file) + self._digest(rides_file)
+        digest = hashlib.sha256(digest.encode()).hexdigest()[:32]
+
+        result = self._get(digest, start, end)
+        if result is not None:
+            self.hits += 1
+        else:
+            result = self._compose(digest, start, end)
+            if result is not None:
+                self.composed += 1
+            else:
+                self.misses += 1
+                result = self._simulate(digest, stations_file, rides_file,
+                                        start, end)
+            self._put(digest, start, end, result)
+
+        names = self._names[digest]
+        size = len(names)
+        return {statistic: find_max(zip(names, result.counters[
+            block * size:(block + 1) * size]))
+                for block, (_, statistic) in enumerate(COUNTERS)}
+
+    def _digest(self, path: str) -> str:
+        """Return the SHA-256 digest of the contents of <path>.
+
+        Digests are remembered until the file's size or modification time
+        changes.
+        """
+        status = os.stat(path)
+        key = (os.path.abspath(path), status.st_size, status.st_mtime)
+        if key not in self._digests:
+            sha = hashlib.sha256()
+            with open(path, 'rb') as file:
+                for chunk in iter(lambda: file.read(1 << 20), b''):
+                    sha.update(chunk)
+            self._digests[key] = sha.hexdigest()
+        return self._digests[key]
+
+    def _simulate(self, digest: str, stations_file: str, rides_file: str,
+                  start: datetime, end: datetime) -> WindowResult:
+        """Run a simulation from <start> to <end> and return its result."""
+        sim = Simulation(stations_file, rides_file, visualize=False)
+        sim.run(start, end)
+
+        stations = list(sim.all_stations.values())
+        self._names[digest] = [station.name for station in stations]
+        counters = array('q')
+        for attribute, _ in COUNTERS:
+            counters.extend(getattr(station, attribute)
+                            for station in stations)
+
+        # Rides only start on whole minutes, so none can start exactly at
+        # an end that is not on a whole minute.
+        starts_at_end = 0
+        if _whole_minute(end):
+            end_minute = to_minutes(end)
+            starts_at_end = sum(1 for ride in sim.all_rides
+                                if ride.start_minute == end_minute)
+        return WindowResult(counters, len(sim.active_rides), starts_at_end)
+
+    def _compose(self, digest: str, start: datetime, end: datetime) \
+            -> Optional[WindowResult]:
+        """Return the result from <start> to <end> composed from the cached
+        results of contiguous sub-windows, or None if there are not enough
+        of them.
+
+        Only windows starting and ending on whole minutes are composed.
+        """
+        if not (_whole_minute(start) and _whole_minute(end)):
+            return None
+
+        # Depth-first search for a chain of cached windows from start to
+        # end, where every window but the last is closed
+        stack = [(start, [])]
+        seen = set()
+        while stack:
+            time, chain = stack.pop()
+            for window_end in self._ends.get((digest, time), ()):
+                if not (time < window_end <= end and
+                        _whole_minute(window_end)):
+                    continue
+                result = self._get(digest, time, window_end)
+                if result is None:
+                    continue
+                if window_end == end:
+                    if not chain:
+                        # A single window is not a composition; it would
+                        # have been found by _get already
+                        continue
+                    composed = chain[0]
+                    for part in chain[1:] + [result]:
+                        composed = composed.then(part)
+                    return composed
+                if result.closed() and window_end not in seen:
+                    seen.add(window_end)
+                    stack.append((window_end, chain + [result]))
+        return None
+
+    def _get(self, digest: str, start: datetime, end: datetime) \
+            -> Optional[WindowResult]:
+        """Return the cached result for the given window, or None.
+
+        Results that are only on disk are loaded back into memory.
+        """
+        key = (digest, start, end)
+        result = self._results.get(key)
+        if result is not None:
+            self._results.move_to_end(key)
+            return result
+        if self.directory is None or not (_whole_minute(start) and
+                                          _whole_minute(end)) or \
+                not os.path.exists(self._path(key)):
+            return None
+        with open(self._path(key)) as file:
+            data = json.load(file)
+        result = WindowResult(array('q', data['counters']),
+                              data['active_at_end'], data['starts_at_end'])
+        self._names.setdefault(digest, data['names'])
+        self._remember(key, result)
+        return result
+
+    def _put(self, digest: str, start: datetime, end: datetime,
+             result: WindowResult) -> None:
+        """Add <result> to the cache, and persist it if there is a
+        directory.
+        """
+        key = (digest, start, end)
+        self._ends.setdefault((digest, start), set()).add(end)
+        if self.directory is not None and _whole_minute(start) and \
+                _whole_minute(end):
+            with open(self._path(key), 'w') as file:
+                json.dump({'names': self._names[digest],
+                           'counters': list(result.counters),
+                           'active_at_end': result.active_at_end,
+                           'starts_at_end': result.starts_at_end}, file)
+        self._remember(key, result)
+
+    def _remember(self, key: Tuple[str, datetime, datetime],
+                  result: WindowResult) -> None:
+        """Keep <result> in memory, evicting the least recently used
+        results if this goes over the budget.
+        """
+        if key in self._results:
+            self._bytes -= self._results.pop(key).nbytes()
+        self._results[key] = result
+        self._bytes += result.nbytes()
+        while self._bytes > self.max_bytes and len(self._results) > 1:
+            old_key, old = self._results.popitem(last=False)
+            self._bytes -= old.nbytes()
+            if self.directory is None or not os.path.exists(
+                    self._path(old_key)):
+                # The result is gone for good
+                self._ends[old_key[:2]].discard(old_key[2])
+
+    def _path(self, key: Tuple[str, datetime, datetime]) -> str:
+        """Return the file that the result with <key> is persisted to."""
+        digest, start, end = key
+        return os.path.join(self.directory, '{}_{}_{}.json'.format(
+            digest, to_minutes(start), to_minutes(end)))
+
+
+def _whole_minute(time: datetime) -> bool:
+    """Return whether <time> is on a whole minute."""
+    return time.second == 0 and time.microsecond == 0
@@ -8,12 +8,14 @@ University of Toronto
 
 === Module Description ===
 
-This module contains the Container and PriorityQueue classes.
+This module contains the Container and PriorityQueue classes, and the
+EventQueue class used by the simulation engine.
 
 Your only task here is to implement the add method for PriorityQueue,
 according to its docstring.
 """
-from typing import Generic, List, TypeVar
+import heapq
+from typing import Generic, Iterable, List, Tuple, TypeVar
 
 # Ignore this line; it is only used to facilitate PyCharm's typechecking.
 T = TypeVar('T')
@@ -101,6 +103,16 @@ class PriorityQueue(Container[T]):
         """
         return self._queue.pop()
 
+    def __len__(self) -> int:
+        """Return the number of items in this PriorityQueue.
+
+        >>> pq = PriorityQueue()
+        >>> pq.add('fred')
+        >>> len(pq)
+        1
+        """
+        return len(self._queue)
+
     def is_empty(self):
         """Return True iff this PriorityQueue is empty.
 
@@ -114,6 +126,76 @@ class PriorityQueue(Container[T]):
         return not self._queue
 
 
+class EventQueue(Container[Tuple]):
+    """A priority queue of events encoded as tuples.
+
+    Each item is a tuple whose first element is the time of the event and
+    whose second element is a sequence number that is unique within the
+    queue. Items are removed in increasing order, so events happen in time
+    order, and events at the same time happen in the order of their
+    sequence numbers.
+
+    Because the items are plain tuples of ints, all comparisons are done by
+    the interpreter itself rather than by a Python-level __lt__ method.
+
+    === Private Attributes ===
+    _heap: List[Tuple]
+      A binary heap (see the heapq module) of the items in the queue.
+    """
+    _heap: List[Tuple]
+
+    def __init__(self) -> None:
+        """Initialize this to an empty EventQueue.
+        """
+        self._heap = []
+
+    def add(self, item: Tuple) -> None:
+        """Add <item> to this EventQueue.
+
+        >>> eq = EventQueue()
+        >>> eq.add((5, 0, 'late'))
+        >>> eq.add((3, 1, 'early'))
+        >>> eq.remove()
+        (3, 1, 'early')
+        """
+        heapq.heappush(self._heap, item)
+
+    def extend(self, items: Iterable[Tuple]) -> None:
+        """Add all of <items> to this EventQueue.
+
+        This is faster than adding the items one at a time.
+        """
+        self._heap.extend(items)
+        heapq.heapify(self._heap)
+
+    def remove(self) -> Tuple:
+        """Remove and return the next item from this EventQueue.
+
+        Precondition: this event queue is non-empty.
+        """
+        return heapq.heappop(self._heap)
+
+    def next_time(self) -> int:
+        """Return the time of the next item in this EventQueue.
+
+        Precondition: this event queue is non-empty.
+        """
+        return self._heap[0][0]
+
+    def __len__(self) -> int:
+        """Return the number of items in this EventQueue.
+        """
+        return len(self._heap)
+
+    def is_empty(self) -> bool:
+        """Return True iff this EventQueue is empty.
+
+        >>> EventQueue().is_empty()
+        True
+        """
+        return not self._heap
+
+
 # if __name__ == '__main__':
 #     import doctest
 #     doctest.testmod()
@@ -0,0 +1,259 @@
+"""Assignment 1 - Differential engine tests
+
+=== Module Description ===
+
+This file contains a harness that runs several simulation engines on the
+same rides and checks that they agree, and reports how much faster each
+engine is than the reference, over ride sets of increasing size.
+
+Two engines agree when, after every minute of the run, they have the same
+set of active rides, and when they end with the same statistics (as
+returned by Simulation.calculate_statistics) and the same number of bikes
+at every station.
+
+The engines are in ENGINES:
+  - 'scan' is the reference: every minute, it scans all the rides of the
+    run for the ones that start, and all the active rides for the ones
+    that end. It is slow but obviously follows the semantics of a run: it
+    works on datetime objects as the handout describes, without the
+    integer minutes of the engine, so that those are checked too.
+  - 'queue' is Simulation.run, driven by the event queue.
+A new engine is added by adding it to ENGINES.
+
+Simulation._update_active_rides, the original scanning engine, is not one
+of them: it also counts the rides that started before the run, ends rides
+one minute later, and moves bikes in every run, so its results are not
+meant to match the ones of Simulation.run.
+
+Run this file to print the speedup curve of every engine.
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from benchmark import FIRST_DAY, generate_rides
+from bikeshare import to_minutes
+from simulation import Simulation
+
+# An engine runs a simulation from a start to an end time, calling the
+# observer with each minute once all of its events are processed.
+Engine = Callable[[Simulation, datetime, datetime, Callable[[int], None]],
+                  None]
+
+# The default sizes of the ride sets of a speedup curve
+CURVE_SIZES = [500, 1000, 2000, 4000, 8000]
+
+
+def run_scan(sim: Simulation, start: datetime, end: datetime,
+             observe: Callable[[int], None]) -> None:
+    """Run <sim> from <start> to <end> by scanning the rides every minute.
+    """
+    step = timedelta(minutes=1)
+    waiting = [ride for ride in sim.all_rides
+               if start < ride.start_time < end]
+    time = start
+    while time < end:
+        time += step
+        for station in sim.all_stations.values():
+            station.check_space()
+
+        minute = to_minutes(time)
+        sim.current_minute = minute
+        later = []
+        for ride in waiting:
+            if ride.start_time > time:
+                later.append(ride)
+                continue
+            sim.active_rides[ride] = ride
+            ride.start.num_bikes_start += 1
+            if sim.track_occupancy and ride.start.num_bikes > 0:
+                ride.start.num_bikes -= 1
+                sim.occupancy_changed(ride.start)
+        waiting = later
+
+        # Rides end in the order they started, as in the event queue
+        for ride in list(sim.active_rides):
+            if ride.end_time <= time:
+                del sim.active_rides[ride]
+                ride.end.num_bikes_end += 1
+                if sim.track_occupancy and \
+                        ride.end.num_bikes < ride.end.capacity:
+                    ride.end.num_bikes += 1
+                    sim.occupancy_changed(ride.end)
+        observe(minute)
+
+
+def run_queue(sim: Simulation, start: datetime, end: datetime,
+              observe: Callable[[int], None]) -> None:
+    """Run <sim> from <start> to <end> with Simulation.run."""
+    sim.add_tick_listener(observe)
+    sim.run(start, end)
+
+
+ENGINES: Dict[str, Engine] = {
+    'scan': run_scan,
+    'queue': run_queue,
+}
+
+# The engine that the others are compared to
+REFERENCE = 'scan'
+
+
+class EngineResult:
+    """The outcome of one engine's run.
+
+    === Attributes ===
+    engine:
+        the name of the engine
+    statistics:
+        the statistics at the end of the run
+    bikes:
+        the number of bikes at each station at the end of the run
+    trace:
+        for each minute of the run, the minute, the number of active rides
+        and the hash of the set of their positions in all_rides
+    seconds:
+        the time taken by the run, in seconds
+    """
+    engine: str
+    statistics: Dict[str, Tuple[str, float]]
+    bikes: List[int]
+    trace: List[Tuple[int, int, int]]
+    seconds: float
+
+    def __init__(self, engine: str, sim: Simulation,
+                 trace: List[Tuple[int, int, int]], seconds: float) -> None:
+        """Record the outcome of <engine>'s run of <sim>."""
+        self.engine = engine
+        self.statistics = sim.calculate_statistics()
+        self.bikes = [station.num_bikes
+                      for station in sim.all_stations.values()]
+        self.trace = trace
+        self.seconds = seconds
+
+    def mismatch(self, other: 'EngineResult') -> Optional[str]:
+        """Return a description of the first difference between this result
+        and <other>, or None if they agree.
+        """
+        for mine, theirs in zip(self.trace, other.trace):
+            if mine != theirs:
+                return 'active rides differ at minute {}: {} and {} ' \
+                       'rides'.format(mine[0], mine[1], theirs[1])
+        if len(self.trace) != len(other.trace):
+            return 'runs have {} and {} minutes'.format(len(self.trace),
+                                                        len(other.trace))
+        if self.statistics != other.statistics:
+            return 'statistics differ: {} and {}'.format(self.statistics,
+                                                          other.statistics)
+        if self.bikes != other.bikes:
+            return 'numbers of bikes at the stations differ'
+        return None
+
+
+def run_engine(engine: str, stations_file: str, rides_file: str,
+               start: datetime, end: datetime, track: bool = False,
+               traced: bool = True) -> EngineResult:
+    """Return the result of a run of <engine> on the given files from
+    <start> to <end>, with occupancy tracking if <track>.
+
+    Only the run itself is timed. If not <traced>, the active rides are not
+    recorded, so that the time is only the engine's.
+    """
+    sim = Simulation(stations_file, rides_file, visualize=False)
+    if track:
+        sim.enable_occupancy_tracking()
+    positions = {ride: index for index, ride in enumerate(sim.all_rides)}
+    trace = []
+
+    def observe(minute: int) -> None:
+        """Record the active rides after <minute>."""
+        if traced:
+            active = frozenset(positions[ride] for ride in sim.active_rides)
+            trace.append((minute, len(active), hash(active)))
+
+    started = time.perf_counter()
+    ENGINES[engine](sim, start, end, observe)
+    return EngineResult(engine, sim, trace, time.perf_counter() - started)
+
+
+def compare_engines(stations_file: str, rides_file: str, start: datetime,
+                    end: datetime, engines: Optional[List[str]] = None,
+                    track: bool = False) -> Dict[str, EngineResult]:
+    """Run every engine in <engines> (by default, all of ENGINES) on the
+    given files from <start> to <end>, and return their results.
+
+    Raise an AssertionError if any of them disagrees with the first one.
+    """
+    engines = engines or list(ENGINES)
+    results = {engine: run_engine(engine, stations_file, rides_file, start,
+                                  end, track)
+               for engine in engines}
+    expected = results[engines[0]]
+    for engine in engines[1:]:
+        difference = results[engine].mismatch(expected)
+        if difference is not None:
+            raise AssertionError('{} disagrees with {}: {}'.format(
+                engine, engines[0], difference))
+    return results
+
+
+def speedup_curve(sizes: List[int] = None,
+                  stations_file: str = 'stations.json', seed: int = 148,
+                  track: bool = False) -> List[Dict]:
+    """Check every engine on one generated day of rides for each of
+    <sizes>, and return the time of each engine and its speedup over
+    REFERENCE, for each size.
+
+    The times are taken from separate runs without tracing.
+
+    Raise an AssertionError if any engine disagrees with REFERENCE.
+    """
+    engines = [REFERENCE] + [engine for engine in ENGINES
+                             if engine != REFERENCE]
+    start = FIRST_DAY
+    end = FIRST_DAY + timedelta(days=1)
+    curve = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes or CURVE_SIZES:
+            rides_file = os.path.join(directory, '{}.csv'.format(size))
+            generate_rides(rides_file, size, 1, stations_file, seed)
+            compare_engines(stations_file, rides_file, start, end, engines,
+                            track)
+            seconds = {engine: run_engine(engine, stations_file, rides_file,
+                                          start, end, track, False).seconds
+                       for engine in engines}
+            curve.append({
+                'rides': size,
+                'seconds': seconds,
+                'speedup': {engine: seconds[REFERENCE] / max(taken, 1e-9)
+                            for engine, taken in seconds.items()}})
+    return curve
+
+
+def main(argv: List[str]) -> None:
+    """Print the speedup curve of every engine from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', type=int, default=CURVE_SIZES)
+    parser.add_argument('--stations', default='stations.json')
+    parser.add_argument('--seed', type=int, default=148)
+    parser.add_argument('--track', action='store_true',
+                        help='move bikes between stations')
+    args = parser.parse_args(argv)
+
+    curve = speedup_curve(args.sizes, args.stations, args.seed, args.track)
+    engines = list(curve[0]['seconds']) if curve else []
+    print('{:>8}'.format('rides') + ''.join(
+        '{:>18}'.format(engine) for engine in engines))
+    for point in curve:
+        print('{:>8}'.format(point['rides']) + ''.join(
+            '{:>9.3f}s {:>6.1f}x'.format(point['seconds'][engine],
+                                         point['speedup'][engine])
+            for engine in engines))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,165 @@
+"""Assignment 1 - Occupancy history
+
+=== Module Description ===
+
+This file contains the OccupancyHistory class, which records the number of
+bikes at every station during a run, so that the occupancy at any past
+instant can be answered without running the simulation again.
+
+The history is made of compact snapshots of the number of bikes at every
+station, taken at most once per interval, and a log of every change made
+between them. state_at restores the last snapshot before the requested
+time and replays the changes logged after it, which are at most one
+interval's worth.
+
+Changes are recorded from the simulation's occupancy listeners, so nothing
+is done during minutes where no station changes, and snapshots are only
+taken when they are needed: just before the first change after an interval
+boundary. In the default mode of the simulation, rides do not move bikes;
+call Simulation.enable_occupancy_tracking (or add a RebalancingFleet) for
+the history to follow them.
+"""
+from array import array
+import bisect
+from datetime import datetime
+from typing import Dict, List
+
+from bikeshare import Station, to_minutes
+from simulation import Simulation
+
+
+class OccupancyHistory:
+    """A record of the number of bikes at every station of a simulation.
+
+    === Attributes ===
+    simulation:
+        the simulation whose stations are recorded
+    interval:
+        the minimum time between two snapshots, in minutes
+
+    === Representation Invariants ===
+    - interval > 0
+    """
+    simulation: Simulation
+    interval: int
+
+    # === Private attributes ===
+    # _ids: the id of each recorded station, in the order of their index.
+    # _index: the index of each recorded station, keyed by the station.
+    # _current: the number of bikes at each station, as last recorded.
+    # _snapshot_minutes: the minute at which each snapshot was taken, in
+    #   increasing order. A snapshot holds the state before any change of
+    #   that minute.
+    # _snapshots: the number of bikes at each station in each snapshot.
+    # _snapshot_deltas: the number of logged changes when each snapshot was
+    #   taken.
+    # _next_snapshot: the first minute at which a new snapshot is due.
+    # _delta_minutes, _delta_stations, _delta_bikes: the minute, station
+    #   index and new number of bikes of each logged change, in order.
+    _ids: List[str]
+    _index: Dict[Station, int]
+    _current: array
+    _snapshot_minutes: List[int]
+    _snapshots: List[array]
+    _snapshot_deltas: List[int]
+    _next_snapshot: int
+    _delta_minutes: array
+    _delta_stations: array
+    _delta_bikes: array
+
+    def __init__(self, simulation: Simulation, interval: int = 15) -> None:
+        """Start recording the stations of <simulation>, taking a snapshot
+        at most every <interval> minutes.
+
+        The current state of the stations is the state before any recorded
+        change.
+        """
+        self.simulation = simulation
+        self.interval = interval
+        self.clear()
+        simulation.add_occupancy_listener(self._on_occupancy_change)
+
+    def clear(self) -> None:
+        """Forget everything recorded so far, and start again from the
+        current state of the stations.
+
+        Call this before running the simulation over an earlier window.
+        """
+        stations = self.simulation.all_stations
+        self._ids = list(stations)
+        self._index = {station: index
+                       for index, station in enumerate(stations.values())}
+        self._current = array('i', (station.num_bikes
+                                    for station in stations.values()))
+        self._snapshot_minutes = []
+        self._snapshots = []
+        self._snapshot_deltas = []
+        self._next_snapshot = 0
+        self._delta_minutes = array('q')
+        self._delta_stations = array('i')
+        self._delta_bikes = array('i')
+        self._snapshot(-1)
+
+    def _snapshot(self, minute: int) -> None:
+        """Take a snapshot of the current state at <minute>."""
+        self._snapshot_minutes.append(minute)
+        self._snapshots.append(array('i', self._current))
+        self._snapshot_deltas.append(len(self._delta_minutes))
+        self._next_snapshot = (minute // self.interval + 1) * self.interval
+
+    def _on_occupancy_change(self, station: Station) -> None:
+        """Log the new number of bikes at <station>."""
+        minute = self.simulation.current_minute
+        if minute >= self._next_snapshot:
+            self._snapshot(minute)
+
+        index = self._index.get(station)
+        if index is None:
+            # A station added during the run had no bikes before
+            index = len(self._ids)
+            self._index[station] = index
+            self._ids.append(next(
+                _id for _id, other in self.simulation.all_stations.items()
+                if other is station))
+            self._current.append(0)
+            for snapshot in self._snapshots:
+                snapshot.append(0)
+
+        self._current[index] = station.num_bikes
+        self._delta_minutes.append(minute)
+        self._delta_stations.append(index)
+        self._delta_bikes.append(station.num_bikes)
+
+    def state_at(self, time: datetime) -> Dict[str, int]:
+        """Return the number of bikes at each station at <time>, keyed by
+        station id.
+
+        The state at a time is the state after the simulation processed the
+        minute containing it.
+        """
+        minute = to_minutes(time)
+        position = bisect.bisect_right(self._snapshot_minutes, minute) - 1
+        state = array('i', self._snapshots[max(position, 0)])
+        if position >= 0:
+            first = self._snapshot_deltas[position]
+            last = bisect.bisect_right(self._delta_minutes, minute, first)
+            stations = self._delta_stations
+            bikes = self._delta_bikes
+            for delta in range(first, last):
+                state[stations[delta]] = bikes[delta]
+        return dict(zip(self._ids, state))
+
+    def changes(self) -> int:
+        """Return the number of changes recorded."""
+        return len(self._delta_minutes)
+
+    def nbytes(self) -> int:
+        """Return the approximate memory used by the snapshots and the log,
+        in bytes.
+        """
+        snapshots = sum(len(snapshot) * snapshot.itemsize
+                        for snapshot in self._snapshots)
+        log = len(self._delta_minutes) * (self._delta_minutes.itemsize +
+                                          self._delta_stations.itemsize +
+                                          self._delta_bikes.itemsize)
+        return snapshots + log
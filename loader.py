@@ -0,0 +1,183 @@
+"""Assignment 1 - Parallel ride loader
+
+=== Module Description ===
+
+This file contains load_rides, which loads the rides of a large CSV file
+with several worker processes.
+
+The file is split into byte ranges that start and end on line boundaries,
+and each worker parses whole ranges into columns of ints (see RideColumns),
+using the station index it received once when the pool started. The
+columns are much cheaper to send back than Ride objects; the Ride objects
+are only created in this process, from the columns of each range in order.
+
+The result is the same as the result of create_rides, in the same order.
+When sorted output is requested, each worker also sorts its range by start
+time, and the sorted ranges are combined with a k-way merge. The merge and
+the sorts are stable, so the result is then the same as sorting the result
+of create_rides by start time.
+
+As for create_rides, no field of the file may contain a line break.
+"""
+from array import array
+import csv
+import heapq
+import io
+import locale
+import os
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from bikeshare import Ride, Station
+from simulation import parse_minutes, station_index
+
+# Files smaller than this are parsed in this process, in one range
+MIN_PARALLEL_BYTES = 1 << 20
+
+# The station index of the current worker process, set by _load_index
+_index = None
+
+
+class RideColumns:
+    """The rides of one byte range of a file, as columns.
+
+    === Attributes ===
+    start_times:
+        the start time of each ride, in minutes since EPOCH
+    start_stations:
+        the index of the start station of each ride
+    end_times:
+        the end time of each ride, in minutes since EPOCH
+    end_stations:
+        the index of the end station of each ride
+
+    === Representation Invariants ===
+    - all the columns have the same length
+    """
+    start_times: array
+    start_stations: array
+    end_times: array
+    end_stations: array
+
+    def __init__(self) -> None:
+        """Initialize empty columns."""
+        self.start_times = array('q')
+        self.start_stations = array('i')
+        self.end_times = array('q')
+        self.end_stations = array('i')
+
+    def __len__(self) -> int:
+        """Return the number of rides in these columns."""
+        return len(self.start_times)
+
+    def rows(self) -> Iterator[Tuple[int, int, int, int]]:
+        """Yield the rides as (start time, start station, end time, end
+        station), in order.
+        """
+        return zip(self.start_times, self.start_stations, self.end_times,
+                   self.end_stations)
+
+
+def split_ranges(path: str, parts: int) -> List[Tuple[int, int]]:
+    """Return about <parts> byte ranges, as (start, end), that cover the
+    file at <path>, each starting at the beginning of a line and ending
+    after the end of a line.
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as file:
+        for part in range(1, parts):
+            position = max(size * part // parts, bounds[-1])
+            if position >= size:
+                break
+            if position > 0:
+                # Move to the start of the next line, unless a line starts
+                # right at position
+                file.seek(position - 1)
+                file.readline()
+                position = file.tell()
+            bounds.append(position)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:])
+            if start < end]
+
+
+def parse_range(path: str, start: int, end: int, index: Dict[str, int],
+                sort: bool = False) -> RideColumns:
+    """Return the rides in bytes <start> to <end> of the file at <path>,
+    using station <index> (see station_index), in the order of the file or
+    sorted by start time if <sort>.
+
+    As in create_rides, rides whose start or end station is not in <index>
+    are ignored, and the file is read with the locale's encoding and
+    universal newlines.
+    """
+    with open(path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    text = data.decode(locale.getpreferredencoding(False))
+    records = []
+    for line in csv.reader(io.StringIO(text, newline=None)):
+        start_station = index.get(line[1])
+        end_station = index.get(line[3])
+        if start_station is not None and end_station is not None:
+            records.append((parse_minutes(line[0]), start_station,
+                            parse_minutes(line[2]), end_station))
+    if sort:
+        records.sort(key=lambda record: record[0])
+
+    columns = RideColumns()
+    if records:
+        start_times, start_stations, end_times, end_stations = \
+            zip(*records)
+        columns.start_times.extend(start_times)
+        columns.start_stations.extend(start_stations)
+        columns.end_times.extend(end_times)
+        columns.end_stations.extend(end_stations)
+    return columns
+
+
+def _load_index(index: Dict[str, int]) -> None:
+    """Keep the station index in a worker process."""
+    global _index
+    _index = index
+
+
+def _parse_job(job: Tuple[str, int, int, bool]) -> RideColumns:
+    """Parse one byte range in a worker process."""
+    path, start, end, sort = job
+    return parse_range(path, start, end, _index, sort)
+
+
+def load_rides(rides_file: str, stations: Dict[str, Station],
+               processes: Optional[int] = None, sort: bool = False) \
+        -> List[Ride]:
+    """Return the rides described in <rides_file>, exactly as create_rides
+    would, or sorted by start time if <sort>.
+
+    The file is parsed in a pool of <processes> worker processes (by
+    default, one per CPU). With processes=1, or for small files, it is
+    parsed in this process.
+    """
+    index = station_index(stations)
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or os.path.getsize(rides_file) < MIN_PARALLEL_BYTES:
+        chunks = [parse_range(rides_file, 0, os.path.getsize(rides_file),
+                              index, sort)]
+    else:
+        # A few ranges per process, so that slow ranges even out
+        jobs = [(rides_file, start, end, sort)
+                for start, end in split_ranges(rides_file, processes * 4)]
+        with Pool(processes, _load_index, (index,)) as pool:
+            chunks = pool.map(_parse_job, jobs)
+
+    if sort:
+        records = heapq.merge(*(chunk.rows() for chunk in chunks),
+                              key=lambda record: record[0])
+    else:
+        records = (record for chunk in chunks for record in chunk.rows())
+    by_index = list(stations.values())
+    return [Ride.from_minute_range(by_index[start_station],
+                                   by_index[end_station],
+                                   (start_time, end_time))
+            for start_time, start_station, end_time, end_station in records]
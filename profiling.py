@@ -0,0 +1,139 @@
+"""Assignment 1 - Simulation profiling
+
+=== Module Description ===
+
+This file contains the SimulationProfile class, which collects per-phase
+timing and event counters for a Simulation that was created with
+profile=True.
+
+Profiles can be exported as JSON, or as a stats file that the standard
+pstats module (and tools built on it, such as snakeviz) can read. When the
+profile is created with use_cprofile=True, the full cProfile output of the
+run is exported instead.
+"""
+import cProfile
+import json
+import marshal
+import time
+from typing import Any, Dict, Optional
+
+# Phases of a simulation, in the order they happen
+PHASES = ['create_stations', 'create_rides', 'queue', 'check_space',
+          'listeners', 'render']
+
+
+class SimulationProfile:
+    """Timing and counters collected while a simulation runs.
+
+    === Attributes ===
+    phase_time:
+        the total wall time spent in each phase, in seconds
+    phase_calls:
+        the number of times each phase was entered
+    events_processed:
+        the number of events removed from the priority queue and processed
+    ticks:
+        the number of minutes simulated
+    max_queue_depth:
+        the largest number of events waiting in the priority queue
+    max_active_rides:
+        the largest number of rides active at the same time
+    """
+    phase_time: Dict[str, float]
+    phase_calls: Dict[str, int]
+    events_processed: int
+    ticks: int
+    max_queue_depth: int
+    max_active_rides: int
+
+    # === Private attributes ===
+    # _profiler: the cProfile profiler that runs alongside, if any.
+    _profiler: Optional[cProfile.Profile]
+
+    def __init__(self, use_cprofile: bool = False) -> None:
+        """Initialize an empty profile.
+
+        If <use_cprofile> is True, also collect a full cProfile profile of
+        every run.
+        """
+        self.phase_time = {phase: 0.0 for phase in PHASES}
+        self.phase_calls = {phase: 0 for phase in PHASES}
+        self.events_processed = 0
+        self.ticks = 0
+        self.max_queue_depth = 0
+        self.max_active_rides = 0
+        self._profiler = cProfile.Profile() if use_cprofile else None
+
+    @staticmethod
+    def clock() -> float:
+        """Return the current value of the clock used to time phases."""
+        return time.perf_counter()
+
+    def record(self, phase: str, started: float) -> float:
+        """Add the time elapsed since <started> to <phase>.
+
+        Return the current clock value, so that consecutive phases can be
+        timed without reading the clock twice.
+        """
+        now = time.perf_counter()
+        self.phase_time[phase] += now - started
+        self.phase_calls[phase] += 1
+        return now
+
+    def record_tick(self, events: int, queue_depth: int,
+                    active_rides: int) -> None:
+        """Record the counters at the end of a simulated minute."""
+        self.ticks += 1
+        self.events_processed += events
+        if queue_depth > self.max_queue_depth:
+            self.max_queue_depth = queue_depth
+        if active_rides > self.max_active_rides:
+            self.max_active_rides = active_rides
+
+    def start_run(self) -> None:
+        """Start the cProfile profiler, if there is one."""
+        if self._profiler is not None:
+            self._profiler.enable()
+
+    def end_run(self) -> None:
+        """Stop the cProfile profiler, if there is one."""
+        if self._profiler is not None:
+            self._profiler.disable()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the contents of this profile as a JSON-compatible dict."""
+        return {
+            'phases': {phase: {'seconds': self.phase_time[phase],
+                               'calls': self.phase_calls[phase]}
+                       for phase in PHASES},
+            'events_processed': self.events_processed,
+            'ticks': self.ticks,
+            'max_queue_depth': self.max_queue_depth,
+            'max_active_rides': self.max_active_rides,
+        }
+
+    def save_json(self, path: str) -> None:
+        """Write this profile to <path> as JSON."""
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def dump_stats(self, path: str) -> None:
+        """Write this profile to <path> in the format used by cProfile.
+
+        The file can be loaded with pstats.Stats(path). Without cProfile,
+        each phase appears as a single function of the simulation module.
+        """
+        if self._profiler is not None:
+            self._profiler.dump_stats(path)
+            return
+
+        stats = {}
+        for line, phase in enumerate(PHASES):
+            calls = self.phase_calls[phase]
+            seconds = self.phase_time[phase]
+            # (primitive calls, total calls, own time, cumulative time,
+            #  callers)
+            stats[('simulation.py', line, phase)] = (calls, calls, seconds,
+                                                     seconds, {})
+        with open(path, 'wb') as file:
+            marshal.dump(stats, file)
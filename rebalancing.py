@@ -0,0 +1,339 @@
+"""Assignment 1 - Rebalancing trucks
+
+=== Module Description ===
+
+This file contains the Truck and RebalancingFleet classes, which simulate
+trucks moving bikes from full stations to empty ones.
+
+A fleet adds three kinds of events to a simulation's event queue:
+  - dispatch: an idle truck is sent to a station to pick up bikes
+  - load: the truck arrives at that station and loads bikes
+  - unload: the truck arrives at the station that needs bikes and unloads
+
+Trucks are dispatched either at scheduled times, between given stations, or
+when a station runs low on bikes. Low stations are detected from the
+simulation's occupancy listeners, so the fleet only does work when the
+number of bikes at a station changes, never once per minute for every
+station. Stations that can give bikes away are tracked the same way.
+
+Adding a fleet turns on occupancy tracking in the simulation, since trucks
+are only useful when rides move bikes between stations. Resetting the
+simulation also resets the fleet: its trucks are freed and emptied, and its
+requests are rebuilt from the current number of bikes at each station. No
+truck is dispatched before a run starts.
+"""
+from collections import OrderedDict, deque
+from datetime import datetime
+import math
+from typing import Deque, Dict, List, Optional, Tuple
+
+from bikeshare import Station, distance, to_minutes
+from simulation import Simulation
+
+
+class Truck:
+    """A truck that carries bikes between stations.
+
+    === Attributes ===
+    name:
+        the name of this truck
+    capacity:
+        the number of bikes this truck can carry
+    load:
+        the number of bikes this truck is carrying
+    location:
+        the station the truck is at, or last left
+    busy:
+        whether the truck is on a job
+    bikes_moved:
+        the total number of bikes this truck has unloaded
+
+    === Representation Invariants ===
+    - 0 <= load <= capacity
+    """
+    name: str
+    capacity: int
+    load: int
+    location: Station
+    busy: bool
+    bikes_moved: int
+
+    def __init__(self, name: str, capacity: int, location: Station) -> None:
+        """Initialize an empty, idle truck at <location>."""
+        self.name = name
+        self.capacity = capacity
+        self.load = 0
+        self.location = location
+        self.busy = False
+        self.bikes_moved = 0
+
+
+class _Job:
+    """A trip of a truck from a source station to a target station.
+
+    === Attributes ===
+    truck:
+        the truck doing this job, or None until the job is dispatched
+    source:
+        the station the bikes are loaded at, or None until the job is
+        dispatched, unless it was given when the job was scheduled
+    target:
+        the station the bikes are unloaded at
+    """
+    truck: Optional[Truck]
+    source: Optional[Station]
+    target: Station
+
+    def __init__(self, source: Optional[Station], target: Station) -> None:
+        """Initialize a job from <source> (or a station chosen when the job
+        is dispatched, if None) to <target>, without a truck.
+        """
+        self.truck = None
+        self.source = source
+        self.target = target
+
+
+class RebalancingFleet:
+    """A fleet of trucks rebalancing the stations of a simulation.
+
+    === Attributes ===
+    simulation:
+        the simulation the trucks work in
+    trucks:
+        the trucks of this fleet
+    low:
+        a station with this many bikes or fewer needs bikes
+    spare:
+        a station with this many empty spots or fewer can give bikes away
+    speed:
+        the average speed of the trucks, in km/h
+    handling:
+        the time taken to load or unload bikes, in minutes
+    moves:
+        every completed move, as (minute of the unload, truck name, source
+        station name, target station name, number of bikes)
+    """
+    simulation: Simulation
+    trucks: List[Truck]
+    low: int
+    spare: int
+    speed: float
+    handling: int
+    moves: List[Tuple[int, str, str, str, int]]
+
+    # === Private attributes ===
+    # _jobs: every job of this fleet; events refer to jobs by position.
+    # _idle: the trucks that are not on a job.
+    # _waiting: the jobs that wait for an idle truck, in order.
+    # _needy: the job serving each station with a pending request for
+    #   bikes, keyed by the station.
+    # _donors: the stations that can give bikes away, each keyed by itself
+    #   (used as an ordered set).
+    # _running: whether a run has started since the last reset; trucks are
+    #   only dispatched during a run.
+    # _dispatch, _load, _unload: the event kinds of this fleet.
+    _jobs: List[_Job]
+    _idle: List[Truck]
+    _waiting: Deque[int]
+    _needy: Dict[Station, int]
+    _donors: 'OrderedDict[Station, Station]'
+    _running: bool
+    _dispatch: int
+    _load: int
+    _unload: int
+
+    def __init__(self, simulation: Simulation, trucks: List[Truck],
+                 low: int = 2, spare: int = 2, speed: float = 25.0,
+                 handling: int = 5) -> None:
+        """Add a fleet of <trucks> to <simulation>.
+
+        This turns on occupancy tracking in the simulation. Stations that
+        are already low when the fleet is created are served from the
+        first minute of the next run.
+        """
+        self.simulation = simulation
+        self.trucks = trucks
+        self.low = low
+        self.spare = spare
+        self.speed = speed
+        self.handling = handling
+
+        self._dispatch = simulation.register_event_kind(self._on_dispatch)
+        self._load = simulation.register_event_kind(self._on_load)
+        self._unload = simulation.register_event_kind(self._on_unload)
+        simulation.enable_occupancy_tracking()
+        simulation.add_occupancy_listener(self._on_occupancy_change)
+        simulation.add_reset_listener(self.reset)
+        simulation.add_start_listener(self._on_start)
+        self.reset()
+
+    def reset(self) -> None:
+        """Discard the state of any previous run: free and empty every
+        truck, forget the moves and the scheduled moves, and rebuild the
+        requests and donors from the current number of bikes at each
+        station.
+
+        The simulation calls this whenever it is reset, since that discards
+        the events of the fleet. Nothing is scheduled until the next run
+        starts.
+        """
+        self.moves = []
+        self._jobs = []
+        for truck in self.trucks:
+            truck.busy = False
+            truck.load = 0
+            truck.bikes_moved = 0
+        self._idle = list(self.trucks)
+        self._waiting = deque()
+        self._needy = {}
+        self._donors = OrderedDict()
+        self._running = False
+
+        # The only pass over all the stations: the initial state
+        for station in self.simulation.all_stations.values():
+            self._on_occupancy_change(station)
+
+    def schedule_move(self, time: datetime, source: str, target: str) \
+            -> None:
+        """Schedule a truck to move bikes from the station with id <source>
+        to the station with id <target>, starting at <time>.
+
+        If no truck is idle at that time, the move waits for the first one
+        that becomes idle. Resetting the simulation cancels the move.
+        """
+        stations = self.simulation.all_stations
+        self._jobs.append(_Job(stations[source], stations[target]))
+        self.simulation.schedule(to_minutes(time), self._dispatch,
+                                 len(self._jobs) - 1)
+
+    def _on_occupancy_change(self, station: Station) -> None:
+        """Update the requests and donors after the number of bikes at
+        <station> changed.
+        """
+        if station.capacity - station.num_bikes <= self.spare:
+            self._donors[station] = station
+        else:
+            self._donors.pop(station, None)
+
+        if station.num_bikes <= self.low and station not in self._needy:
+            self._jobs.append(_Job(None, station))
+            self._needy[station] = len(self._jobs) - 1
+            self._waiting.append(len(self._jobs) - 1)
+            self._assign()
+        elif station.num_bikes > self.low and station in self._needy and \
+                self._jobs[self._needy[station]].truck is None:
+            # Rides refilled the station before a truck was sent there
+            del self._needy[station]
+        elif self._waiting and station in self._donors:
+            # A new donor may unblock a waiting job
+            self._assign()
+
+    def _on_start(self, minute: int) -> None:
+        """Dispatch idle trucks to the jobs that waited for the run to
+        start at <minute>.
+        """
+        self._running = True
+        self._assign()
+
+    def _assign(self) -> None:
+        """Dispatch idle trucks to the waiting jobs, in order, if a run has
+        started.
+        """
+        if not self._running:
+            return
+        while self._waiting and self._idle:
+            index = self._waiting.popleft()
+            job = self._jobs[index]
+            if job.source is None and \
+                    self._needy.get(job.target) != index:
+                continue  # The station no longer needs bikes
+            truck = self._idle.pop()
+            job.truck = truck
+            truck.busy = True
+            self.simulation.schedule(self.simulation.current_minute,
+                                     self._dispatch, index)
+
+    def _travel(self, start: Station, end: Station) -> int:
+        """Return the number of minutes to drive from <start> to <end> and
+        load or unload there.
+        """
+        hours = distance(start.location, end.location) / self.speed
+        return math.ceil(hours * 60) + self.handling
+
+    def _on_dispatch(self, index: int) -> None:
+        """Send the truck of a job to its source station."""
+        job = self._jobs[index]
+        if job.truck is None:
+            # A scheduled move: it needs a truck first
+            self._waiting.append(index)
+            self._assign()
+            return
+
+        if job.source is None:
+            job.source = self._nearest_donor(job.target)
+            if job.source is None:
+                # No station can give bikes away yet; try again when one can
+                job.truck.busy = False
+                self._idle.append(job.truck)
+                job.truck = None
+                self._waiting.appendleft(index)
+                return
+        self.simulation.schedule(
+            self.simulation.current_minute +
+            self._travel(job.truck.location, job.source), self._load, index)
+
+    def _nearest_donor(self, target: Station) -> Optional[Station]:
+        """Return the station that can give bikes away closest to <target>,
+        or None if there is none.
+        """
+        best = None
+        best_distance = math.inf
+        for station in self._donors.values():
+            if station is not target:
+                length = distance(station.location, target.location)
+                if length < best_distance:
+                    best, best_distance = station, length
+        return best
+
+    def _on_load(self, index: int) -> None:
+        """Load bikes at the source station of a job, leaving it half full,
+        and drive to the target station.
+        """
+        job = self._jobs[index]
+        truck, source = job.truck, job.source
+        bikes = min(truck.capacity - truck.load,
+                    max(0, source.num_bikes - source.capacity // 2))
+        truck.load += bikes
+        truck.location = source
+        if bikes:
+            source.num_bikes -= bikes
+            self.simulation.occupancy_changed(source)
+        self.simulation.schedule(
+            self.simulation.current_minute +
+            self._travel(source, job.target), self._unload, index)
+
+    def _on_unload(self, index: int) -> None:
+        """Unload bikes at the target station of a job, filling it up to
+        half of its capacity (and above the low threshold), and free the
+        truck.
+        """
+        job = self._jobs[index]
+        truck, target = job.truck, job.target
+        level = min(target.capacity, max(target.capacity // 2, self.low + 1))
+        bikes = min(truck.load, max(0, level - target.num_bikes))
+        truck.load -= bikes
+        truck.location = target
+        truck.bikes_moved += bikes
+        truck.busy = False
+        self._idle.append(truck)
+        if self._needy.get(target) == index:
+            del self._needy[target]
+        self.moves.append((self.simulation.current_minute, truck.name,
+                           job.source.name, target.name, bikes))
+        if bikes:
+            target.num_bikes += bikes
+            self.simulation.occupancy_changed(target)
+        else:
+            # Nothing changed at the target, but it may still be low
+            self._on_occupancy_change(target)
+        self._assign()
@@ -0,0 +1,240 @@
+"""Assignment 1 - Station time series
+
+=== Module Description ===
+
+This file contains the StationRecorder class, which records the number of
+bikes at every station over a run, either once per minute or at every
+change, in a preallocated ring buffer of fixed size.
+
+The buffer is sized from a memory budget when the recorder is created and
+never grows: once it is full, each new record overwrites the oldest one.
+
+Recording adds little to the event processing. The recorder keeps its own
+copy of the number of bikes at each station, updated by the simulation's
+occupancy listeners only when a station changes. In per-minute mode, that
+copy is then written into the buffer as one slice at the end of each
+minute, instead of reading every station.
+
+Only the stations present when the recorder is created are recorded.
+"""
+from array import array
+import csv
+from typing import Dict, Iterator, List, Tuple
+
+from bikeshare import Station, from_minutes
+from simulation import DATETIME_FORMAT, Simulation
+
+# Recording modes
+PER_MINUTE = 'minute'
+PER_CHANGE = 'change'
+
+# The default memory budget of a recorder, in bytes
+DEFAULT_BUDGET = 16 * 1024 * 1024
+
+
+class StationRecorder:
+    """A fixed-size record of the number of bikes at each station.
+
+    === Attributes ===
+    simulation:
+        the simulation whose stations are recorded
+    mode:
+        PER_MINUTE to record every station at the end of every minute, or
+        PER_CHANGE to record each change of a station
+    station_ids:
+        the ids of the recorded stations, in the order of their columns
+    capacity:
+        the number of records the buffer holds: rows (minutes) in
+        PER_MINUTE mode, changes in PER_CHANGE mode
+    dropped:
+        the number of records overwritten because the buffer was full
+
+    === Representation Invariants ===
+    - capacity > 0
+    """
+    simulation: Simulation
+    mode: str
+    station_ids: List[str]
+    capacity: int
+    dropped: int
+
+    # === Private attributes ===
+    # _index: the column of each recorded station, keyed by the station.
+    # _current: the number of bikes at each recorded station.
+    # _minutes: the minute of each record.
+    # _bikes: in PER_MINUTE mode, one row of len(station_ids) values per
+    #   record; in PER_CHANGE mode, the new number of bikes of each record.
+    # _stations: in PER_CHANGE mode, the column of the station of each
+    #   record.
+    # _head: the position of the next record in the buffer.
+    # _size: the number of records in the buffer.
+    _index: Dict[Station, int]
+    _current: array
+    _minutes: array
+    _bikes: array
+    _stations: array
+    _head: int
+    _size: int
+
+    def __init__(self, simulation: Simulation, mode: str = PER_MINUTE,
+                 budget: int = DEFAULT_BUDGET) -> None:
+        """Start recording the stations of <simulation> in <mode>, using at
+        most about <budget> bytes for the buffer.
+
+        Raise a ValueError if the mode is unknown or the budget is too
+        small for a single record.
+        """
+        if mode not in (PER_MINUTE, PER_CHANGE):
+            raise ValueError('unknown recording mode {}'.format(mode))
+        stations = simulation.all_stations
+        self.simulation = simulation
+        self.mode = mode
+        self.station_ids = list(stations)
+        self.dropped = 0
+        self._index = {station: column
+                       for column, station in enumerate(stations.values())}
+        self._current = array('h', (station.num_bikes
+                                    for station in stations.values()))
+
+        self._minutes = array('q')
+        self._bikes = array('h')
+        self._stations = array('i')
+        width = len(self._current) if mode == PER_MINUTE else 1
+        record = self._minutes.itemsize + width * self._bikes.itemsize
+        if mode == PER_CHANGE:
+            record += self._stations.itemsize
+        self.capacity = budget // record
+        if self.capacity < 1:
+            raise ValueError('a budget of {} bytes is too small'.format(
+                budget))
+
+        # Preallocate the whole buffer
+        self._minutes.frombytes(bytes(self.capacity * self._minutes.itemsize))
+        self._bikes.frombytes(bytes(self.capacity * width *
+                                    self._bikes.itemsize))
+        if mode == PER_CHANGE:
+            self._stations.frombytes(bytes(self.capacity *
+                                           self._stations.itemsize))
+        self._head = 0
+        self._size = 0
+
+        simulation.add_occupancy_listener(self._on_occupancy_change)
+        if mode == PER_MINUTE:
+            simulation.add_tick_listener(self._on_tick)
+
+    def __len__(self) -> int:
+        """Return the number of records held."""
+        return self._size
+
+    def nbytes(self) -> int:
+        """Return the memory used by the buffer, in bytes."""
+        return sum(len(column) * column.itemsize
+                   for column in (self._minutes, self._bikes,
+                                  self._stations))
+
+    def _next_slot(self) -> int:
+        """Return the position of a new record, overwriting the oldest one
+        if the buffer is full.
+        """
+        slot = self._head
+        self._head = (slot + 1) % self.capacity
+        if self._size == self.capacity:
+            self.dropped += 1
+        else:
+            self._size += 1
+        return slot
+
+    def _on_occupancy_change(self, station: Station) -> None:
+        """Update the number of bikes of <station>, and record the change in
+        PER_CHANGE mode.
+        """
+        column = self._index.get(station)
+        if column is None:
+            return
+        self._current[column] = station.num_bikes
+        if self.mode == PER_CHANGE:
+            slot = self._next_slot()
+            self._minutes[slot] = self.simulation.current_minute
+            self._stations[slot] = column
+            self._bikes[slot] = station.num_bikes
+
+    def _on_tick(self, minute: int) -> None:
+        """Record every station at the end of <minute>."""
+        slot = self._next_slot()
+        width = len(self._current)
+        self._minutes[slot] = minute
+        self._bikes[slot * width:(slot + 1) * width] = self._current
+
+    def _slots(self) -> Iterator[int]:
+        """Yield the positions of the records, oldest first."""
+        first = (self._head - self._size) % self.capacity
+        for offset in range(self._size):
+            yield (first + offset) % self.capacity
+
+    def records(self) -> Iterator[Tuple[int, str, int]]:
+        """Yield the records as (minute since EPOCH, station id, number of
+        bikes), oldest first.
+
+        In PER_MINUTE mode, every station is yielded for every minute.
+        """
+        ids = self.station_ids
+        width = len(ids)
+        for slot in self._slots():
+            minute = self._minutes[slot]
+            if self.mode == PER_MINUTE:
+                row = self._bikes[slot * width:(slot + 1) * width]
+                for column, bikes in enumerate(row):
+                    yield minute, ids[column], bikes
+            else:
+                yield minute, ids[self._stations[slot]], self._bikes[slot]
+
+    def series(self, station_id: str) -> List[Tuple[int, int]]:
+        """Return the records of the station with id <station_id>, as
+        (minute since EPOCH, number of bikes), oldest first.
+        """
+        column = self.station_ids.index(station_id)
+        width = len(self.station_ids)
+        if self.mode == PER_MINUTE:
+            return [(self._minutes[slot], self._bikes[slot * width + column])
+                    for slot in self._slots()]
+        return [(self._minutes[slot], self._bikes[slot])
+                for slot in self._slots() if self._stations[slot] == column]
+
+    def to_csv(self, path: str) -> int:
+        """Write the records to a CSV file at <path>, one row per station
+        and record, and return the number of rows written.
+        """
+        rows = 0
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['time', 'station', 'num_bikes'])
+            last_minute = None
+            time = ''
+            for minute, station_id, bikes in self.records():
+                if minute != last_minute:
+                    time = from_minutes(minute).strftime(DATETIME_FORMAT)
+                    last_minute = minute
+                writer.writerow([time, station_id, bikes])
+                rows += 1
+        return rows
+
+    def to_numpy(self) -> Tuple:
+        """Return the records as NumPy arrays, oldest first.
+
+        In PER_MINUTE mode, return (minutes, bikes) where bikes has one row
+        per minute and one column per station. In PER_CHANGE mode, return
+        (minutes, station columns, bikes).
+
+        NumPy is only imported when this is called.
+        """
+        import numpy
+        slots = numpy.fromiter(self._slots(), dtype=numpy.int64,
+                               count=self._size)
+        minutes = numpy.frombuffer(self._minutes, dtype=numpy.int64)[slots]
+        if self.mode == PER_MINUTE:
+            bikes = numpy.frombuffer(self._bikes, dtype=numpy.int16).reshape(
+                self.capacity, len(self.station_ids))
+            return minutes, bikes[slots]
+        return (minutes,
+                numpy.frombuffer(self._stations, dtype=numpy.int32)[slots],
+                numpy.frombuffer(self._bikes, dtype=numpy.int16)[slots])
@@ -0,0 +1,171 @@
+"""Assignment 1 - Station refresh
+
+=== Module Description ===
+
+This file contains the StationRefresher class, which applies a new snapshot
+of the stations file to a running simulation without rebuilding it.
+
+Only the fields of a station that differ from the snapshot are updated, in
+place, so in-flight rides (which refer to the Station objects) and the
+statistics accumulated so far are kept. Stations new to the snapshot are
+added; stations missing from it are reported but kept, since rides may
+still refer to them.
+
+Snapshots are parsed one station at a time with iter_raw_stations, so the
+whole file is never held in memory as one JSON document. A station whose
+last update time ('lu') is the same as in the previous snapshot is skipped
+without being converted at all.
+"""
+import json
+import re
+from typing import Dict, Iterator, List
+
+from bikeshare import Station
+from simulation import Simulation
+
+# The number of characters read from a snapshot at a time
+CHUNK_SIZE = 1 << 16
+
+# The start of the array of stations in a snapshot
+_STATIONS_ARRAY = re.compile(r'"stations"\s*:\s*\[')
+
+# The characters that may separate two stations in the array
+_SEPARATORS = ' \t\n\r,'
+
+
+def iter_raw_stations(stations_file: str) -> Iterator[Dict]:
+    """Yield the raw dictionary of each station in <stations_file>, in
+    order, reading the file in chunks.
+
+    Raise a ValueError if the file has no array of stations, or ends before
+    the end of the array.
+    """
+    decoder = json.JSONDecoder()
+    with open(stations_file, encoding='utf-8') as file:
+        buffer = ''
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                raise ValueError('{} has no stations'.format(stations_file))
+            buffer += chunk
+            match = _STATIONS_ARRAY.search(buffer)
+            if match:
+                buffer = buffer[match.end():]
+                break
+            # Keep enough to find the key if it spans two chunks
+            buffer = buffer[-32:]
+
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in _SEPARATORS:
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                raw, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                # The station is cut by the end of the buffer
+                chunk = file.read(CHUNK_SIZE)
+                if not chunk:
+                    raise ValueError('{} ends inside its stations'.format(
+                        stations_file))
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield raw
+
+
+class StationChanges:
+    """The changes made by applying one snapshot of the stations.
+
+    === Attributes ===
+    updated:
+        the ids of the stations with at least one changed field
+    added:
+        the ids of the stations that were not in the simulation
+    missing:
+        the ids of the stations of the simulation missing from the snapshot
+    skipped:
+        the number of stations not updated since the previous snapshot
+    """
+    updated: List[str]
+    added: List[str]
+    missing: List[str]
+    skipped: int
+
+    def __init__(self) -> None:
+        """Initialize an empty set of changes."""
+        self.updated = []
+        self.added = []
+        self.missing = []
+        self.skipped = 0
+
+
+class StationRefresher:
+    """Applies snapshots of the stations file to a simulation.
+
+    === Attributes ===
+    simulation:
+        the simulation whose stations are refreshed
+    """
+    simulation: Simulation
+
+    # === Private attributes ===
+    # _updated: the last update time ('lu') of each station in the most
+    #   recent snapshot, keyed by station id.
+    _updated: Dict[str, int]
+
+    def __init__(self, simulation: Simulation) -> None:
+        """Initialize a refresher for <simulation>.
+
+        Every station is compared field by field on the first refresh.
+        """
+        self.simulation = simulation
+        self._updated = {}
+
+    def refresh(self, stations_file: str) -> StationChanges:
+        """Apply the snapshot in <stations_file> to the simulation, and
+        return the changes made.
+
+        The occupancy listeners are notified of each added station, and of
+        each station whose number of bikes or capacity changed.
+        """
+        stations = self.simulation.all_stations
+        changes = StationChanges()
+        seen = set()
+        for raw in iter_raw_stations(stations_file):
+            _id = raw['n']
+            seen.add(_id)
+            last_update = raw.get('lu')
+            if last_update is not None and \
+                    self._updated.get(_id) == last_update and \
+                    _id in stations:
+                changes.skipped += 1
+                continue
+            self._updated[_id] = last_update
+
+            location = (float(raw['lo']), float(raw['la']))
+            num_bikes = int(raw['da'])
+            capacity = int(raw['ba']) + num_bikes
+            name = raw['s']
+            station = stations.get(_id)
+            if station is None:
+                stations[_id] = Station(location, capacity, num_bikes, name)
+                changes.added.append(_id)
+                self.simulation.occupancy_changed(stations[_id])
+                continue
+
+            occupancy_changed = station.num_bikes != num_bikes or \
+                station.capacity != capacity
+            if occupancy_changed or station.location != location or \
+                    station.name != name:
+                station.location = location
+                station.capacity = capacity
+                station.name = name
+                station.num_bikes = num_bikes
+                changes.updated.append(_id)
+                if occupancy_changed:
+                    self.simulation.occupancy_changed(station)
+
+        changes.missing = [_id for _id in stations if _id not in seen]
+        return changes
@@ -0,0 +1,239 @@
+"""Assignment 1 - Sharded ride datasets
+
+=== Module Description ===
+
+This file contains the functions used to convert ride CSV files into a
+sharded dataset, and to load only the parts of it that a simulation needs.
+
+A sharded dataset is a directory with one file per day, holding the rides
+that start on that day, and a manifest (MANIFEST_FILE). Within a day file,
+rides are stored in row groups, one per start station. The manifest records
+the byte range, number of rows and first and last start minute of every row
+group, so the reader can skip whole days and whole stations by looking at
+the manifest alone, before reading or parsing anything.
+
+Each row is the original CSV row preceded by its position in the input,
+so that rides are loaded in the same order as from the original files.
+
+write_shards never holds more than SPILL_ROWS rows of the input in memory:
+rows are spilled to a temporary file per day whenever that many are
+pending, and each day is then grouped by station on its own, so at most one
+day of rides is held in memory at that point.
+"""
+import csv
+from datetime import datetime, timedelta
+import heapq
+import io
+import json
+import os
+from typing import (BinaryIO, Collection, Dict, Iterator, List, Optional,
+                    Set, Tuple)
+
+from bikeshare import Ride, Station, from_minutes, to_minutes
+from simulation import DATE_FORMAT, parse_minutes
+
+# The name of the manifest of a sharded dataset
+MANIFEST_FILE = 'manifest.json'
+
+# The version of the layout written by write_shards
+VERSION = 1
+
+# The number of rows kept in memory, over all days, before they are spilled
+SPILL_ROWS = 4096
+
+
+def write_shards(rides_files: List[str], directory: str) -> Dict:
+    """Convert the rides in <rides_files> into a sharded dataset in
+    <directory>, and return its manifest.
+
+    Rides are kept in the order of <rides_files>, then of their rows.
+    <directory> is created if needed; a dataset already there is replaced.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for filename in os.listdir(directory):
+        if filename.endswith('.tmp'):
+            # Left over by an interrupted conversion
+            os.remove(os.path.join(directory, filename))
+    pending = {}
+    spilled = set()
+    # The day of each date as written in the files, which need not be
+    # zero-padded, in DATE_FORMAT
+    days = {}
+    row = 0
+    for rides_file in rides_files:
+        with open(rides_file) as file:
+            for line in csv.reader(file):
+                date = line[0].split(' ')[0]
+                day = days.get(date)
+                if day is None:
+                    day = from_minutes(parse_minutes(line[0]) // 1440 *
+                                       1440).strftime(DATE_FORMAT)
+                    days[date] = day
+                pending.setdefault(day, []).append([str(row)] + line)
+                row += 1
+                if row % SPILL_ROWS == 0:
+                    _spill_all(directory, pending, spilled)
+    _spill_all(directory, pending, spilled)
+
+    manifest = {'version': VERSION, 'days': {}}
+    for day in sorted(spilled):
+        manifest['days'][day] = _write_day(directory, day)
+    with open(os.path.join(directory, MANIFEST_FILE), 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    return manifest
+
+
+def _spill_all(directory: str, pending: Dict[str, List[List[str]]],
+               spilled: Set[str]) -> None:
+    """Append the <pending> rows of each day to the temporary file of the
+    day, add the days to <spilled>, and empty <pending>.
+    """
+    for day, rows in pending.items():
+        with open(_day_path(directory, day) + '.tmp', 'a',
+                  newline='') as file:
+            csv.writer(file).writerows(rows)
+        spilled.add(day)
+    pending.clear()
+
+
+def _write_day(directory: str, day: str) -> Dict:
+    """Group the spilled rows of <day> by start station into its day file,
+    and return the manifest entry of the day.
+    """
+    groups = {}
+    with open(_day_path(directory, day) + '.tmp', newline='') as file:
+        for line in csv.reader(file):
+            groups.setdefault(line[2], []).append(line)
+    os.remove(_day_path(directory, day) + '.tmp')
+
+    entry = {'file': os.path.basename(_day_path(directory, day)),
+             'groups': {}}
+    offset = 0
+    with open(_day_path(directory, day), 'wb') as file:
+        for station_id in sorted(groups):
+            rows = groups[station_id]
+            buffer = io.StringIO(newline='')
+            csv.writer(buffer, lineterminator='\n').writerows(rows)
+            data = buffer.getvalue().encode()
+            file.write(data)
+            starts = [parse_minutes(line[1]) for line in rows]
+            entry['groups'][station_id] = [offset, len(data), len(rows),
+                                           min(starts), max(starts)]
+            offset += len(data)
+    entry['first'] = min(group[3] for group in entry['groups'].values())
+    entry['last'] = max(group[4] for group in entry['groups'].values())
+    return entry
+
+
+def _minute_bounds(start: datetime, end: datetime) -> Tuple[int, int]:
+    """Return the first and last whole minutes from <start> to <end>,
+    inclusive, in minutes since EPOCH.
+
+    >>> start = datetime(1970, 1, 1, 0, 1, 30)
+    >>> _minute_bounds(start, datetime(1970, 1, 1, 0, 3))
+    (2, 3)
+    """
+    first = to_minutes(start)
+    if start.second or start.microsecond:
+        first += 1
+    return first, to_minutes(end)
+
+
+def _day_path(directory: str, day: str) -> str:
+    """Return the path of the file of <day> in <directory>."""
+    return os.path.join(directory, day + '.csv')
+
+
+def read_manifest(directory: str) -> Dict:
+    """Return the manifest of the sharded dataset in <directory>.
+
+    Raise a ValueError if it was written by an unknown version.
+    """
+    with open(os.path.join(directory, MANIFEST_FILE)) as file:
+        manifest = json.load(file)
+    if manifest.get('version') != VERSION:
+        raise ValueError('unsupported sharded dataset version {}'.format(
+            manifest.get('version')))
+    return manifest
+
+
+def select_groups(manifest: Dict, start: datetime, end: datetime,
+                  station_ids: Optional[Collection[str]] = None) \
+        -> List[Tuple[str, str, List[int]]]:
+    """Return the row groups of <manifest> that may have rides starting
+    from <start> to <end> (inclusive) at one of <station_ids>, or at any
+    station if <station_ids> is None, as (file, station id, group entry).
+
+    Only the manifest is used.
+    """
+    first, last = _minute_bounds(start, end)
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    selected = []
+    while day <= end:
+        entry = manifest['days'].get(day.strftime(DATE_FORMAT))
+        day += timedelta(days=1)
+        if entry is None or entry['last'] < first or entry['first'] > last:
+            continue
+        groups = entry['groups']
+        ids = groups if station_ids is None else \
+            [_id for _id in station_ids if _id in groups]
+        for station_id in ids:
+            group = groups[station_id]
+            if group[3] <= last and group[4] >= first:
+                selected.append((entry['file'], station_id, group))
+    return selected
+
+
+def iter_rows(directory: str, start: datetime, end: datetime,
+              station_ids: Optional[Collection[str]] = None) \
+        -> Iterator[List[str]]:
+    """Yield the CSV rows of the rides starting from <start> to <end>
+    (inclusive) at one of <station_ids> (or any station), in the order of
+    the original files.
+
+    Only the row groups selected by select_groups are read.
+    """
+    first, last = _minute_bounds(start, end)
+    groups = select_groups(read_manifest(directory), start, end,
+                           station_ids)
+    files = {}
+    try:
+        streams = []
+        for filename, _, (offset, length, _, _, _) in groups:
+            if filename not in files:
+                files[filename] = open(os.path.join(directory, filename),
+                                       'rb')
+            streams.append(_read_group(files[filename], offset, length))
+        for line in heapq.merge(*streams, key=lambda line: int(line[0])):
+            if first <= parse_minutes(line[1]) <= last:
+                yield line[1:]
+    finally:
+        for file in files.values():
+            file.close()
+
+
+def _read_group(file: BinaryIO, offset: int, length: int) \
+        -> Iterator[List[str]]:
+    """Yield the rows of the row group at <offset> in <file>."""
+    file.seek(offset)
+    data = file.read(length).decode()
+    yield from csv.reader(io.StringIO(data, newline=''))
+
+
+def load_rides(directory: str, stations: Dict[str, Station],
+               start: datetime, end: datetime,
+               station_ids: Optional[Collection[str]] = None) -> List[Ride]:
+    """Return the rides of the sharded dataset in <directory> that start
+    from <start> to <end> (inclusive) at one of <station_ids> (or any
+    station), as create_rides would return them.
+
+    As in create_rides, rides whose start or end station is not in
+    <stations> are ignored.
+    """
+    rides = []
+    for line in iter_rows(directory, start, end, station_ids):
+        if line[1] in stations and line[3] in stations:
+            rides.append(Ride.from_minute_range(
+                stations[line[1]], stations[line[3]],
+                (parse_minutes(line[0]), parse_minutes(line[2]))))
+    return rides
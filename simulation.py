@@ -16,15 +16,35 @@ can use to try running the simulation at any time.
 """
 import csv
 from datetime import datetime, timedelta
+import itertools
 import json
-from typing import Dict, List, Tuple
+from typing import (Callable, Dict, Iterable, Iterator, List, Optional,
+                    Tuple, TYPE_CHECKING)
 
-from bikeshare import Ride, Station
-from container import PriorityQueue
-from visualizer import Visualizer
+from bikeshare import EPOCH, Ride, Station, to_minutes
+from container import EventQueue
+
+if TYPE_CHECKING:
+    # The graphics, profiling and sketch modules are only imported when a
+    # simulation needs them, so that headless runs start quickly.
+    from profiling import SimulationProfile
+    from sketches import TripSketches
+    from visualizer import Visualizer
 
 # Datetime format to parse the ride data
 DATETIME_FORMAT = '%Y-%m-%d %H:%M'
+# Format of the date part of DATETIME_FORMAT
+DATE_FORMAT = '%Y-%m-%d'
+
+# Cache of the minutes since EPOCH of each date seen by parse_minutes
+_DAY_MINUTES = {}
+
+# Kinds of the events in a simulation's event queue. Events are stored as
+# (time, sequence number, kind, index) tuples, and each kind has a handler
+# that is called with the index. See Simulation.register_event_kind.
+KIND_RIDE_START = 0  # index is the position of the ride in all_rides
+KIND_RIDE_END = 1  # index is the position of the ride in all_rides
+KIND_EVENT = 2  # index is the key of an Event object in _pending_events
 
 
 class Simulation:
@@ -38,57 +58,373 @@ class Simulation:
     all_stations:
         A dictionary containing all the stations in this simulation.
     visualizer:
-        A helper class for visualizing the simulation.
+        A helper class for visualizing the simulation, or None if the
+        simulation runs without a window.
     active_rides:
-        A list of all rides currently active
+        All rides currently active, each keyed by itself
     ride_priority_queue:
-        A priority queue for events in the simulation
+        A priority queue for events in the simulation, encoded as tuples
+    profile:
+        Timing and counters collected for this simulation, or None if it
+        is not being profiled
+    current_minute:
+        The minute (since EPOCH) whose events are being processed
+    track_occupancy:
+        Whether rides take bikes from and return bikes to the stations.
+        This is off by default, in which case the number of bikes at each
+        station never changes during a run.
+    trip_sketches:
+        The quantile sketches of the durations and distances of the trips
+        that ended, or None if they are not kept
     """
     all_stations: Dict[str, Station]
     all_rides: List[Ride]
-    visualizer: Visualizer
-    active_rides: List[Ride]
-    ride_priority_queue: PriorityQueue()
-
-    def __init__(self, station_file: str, ride_file: str) -> None:
+    visualizer: Optional['Visualizer']
+    active_rides: Dict[Ride, Ride]
+    ride_priority_queue: EventQueue
+    profile: Optional['SimulationProfile']
+    current_minute: int
+    track_occupancy: bool
+    trip_sketches: Optional['TripSketches']
+
+    # === Private attributes ===
+    # _handlers: the function that processes each kind of event, indexed
+    #   by kind.
+    # _pending_events: the Event objects waiting in the event queue, keyed
+    #   by their sequence number.
+    # _sequence: the source of the events' sequence numbers.
+    # _occupancy_listeners: the functions called whenever the number of
+    #   bikes at a station changes.
+    # _tick_listeners: the functions called at the end of every minute of a
+    #   run.
+    # _ride_end_listeners: the functions called with every ride that ends.
+    # _reset_listeners: the functions called at the end of every reset.
+    # _start_listeners: the functions called at the start of every run.
+    _handlers: List[Callable[[int], None]]
+    _pending_events: Dict[int, 'Event']
+    _sequence: Iterator[int]
+    _occupancy_listeners: List[Callable[[Station], None]]
+    _tick_listeners: List[Callable[[int], None]]
+    _ride_end_listeners: List[Callable[[Ride], None]]
+    _reset_listeners: List[Callable[[], None]]
+    _start_listeners: List[Callable[[int], None]]
+
+    def __init__(self, station_file: str, ride_file: str,
+                 visualize: bool = True, profile: bool = False,
+                 use_cprofile: bool = False) -> None:
         """Initialize this simulation with the given configuration settings.
+
+        If <visualize> is False, the simulation runs without a window, and
+        pygame is never imported.
+        If <profile> is True, record the time spent in each phase of the
+        simulation in self.profile. If <use_cprofile> is also True, a full
+        cProfile profile of each run is recorded as well.
+        """
+        if profile:
+            from profiling import SimulationProfile
+            self.profile = SimulationProfile(use_cprofile)
+            started = self.profile.clock()
+            self.all_stations = create_stations(station_file)
+            started = self.profile.record('create_stations', started)
+            self.all_rides = create_rides(ride_file, self.all_stations)
+            self.profile.record('create_rides', started)
+        else:
+            self.profile = None
+            self.all_stations = create_stations(station_file)
+            self.all_rides = create_rides(ride_file, self.all_stations)
+        self._setup(visualize)
+
+    @classmethod
+    def from_objects(cls, stations: Dict[str, Station], rides: List[Ride],
+                     visualize: bool = False) -> 'Simulation':
+        """Return a simulation of the already loaded <stations> and <rides>.
+
+        The stations and rides are used as they are, not copied.
+        """
+        sim = cls.__new__(cls)
+        sim.all_stations = stations
+        sim.all_rides = rides
+        sim.profile = None
+        sim._setup(visualize)
+        return sim
+
+    def _setup(self, visualize: bool) -> None:
+        """Initialize the parts of this simulation that do not depend on
+        the data.
+        """
+        if visualize:
+            from visualizer import Visualizer
+            self.visualizer = Visualizer()
+        else:
+            self.visualizer = None
+        self._handlers = [self._start_ride, self._end_ride,
+                          self._process_event]
+        self._occupancy_listeners = []
+        self._tick_listeners = []
+        self._ride_end_listeners = []
+        self._reset_listeners = []
+        self._start_listeners = []
+        self.track_occupancy = False
+        self.trip_sketches = None
+        self.reset()
+
+    def reset(self) -> None:
+        """Discard the state of any previous run: empty the event queue and
+        the active rides, and set the statistics of every station to zero.
+
+        The number of bikes at each station is left as it is, and so are
+        the registered event kinds and listeners. The reset listeners are
+        called last, once the event queue is empty.
+        """
+        self.active_rides = {}
+        self.ride_priority_queue = EventQueue()
+        self.current_minute = 0
+        self._pending_events = {}
+        self._sequence = itertools.count()
+        for station in self.all_stations.values():
+            station.num_bikes_start = 0
+            station.num_bikes_end = 0
+            station.total_time_low_availability = 0
+            station.total_time_low_unoccupied = 0
+        if self.trip_sketches is not None:
+            self.trip_sketches.clear()
+        for listener in self._reset_listeners:
+            listener()
+
+    def enable_occupancy_tracking(self) -> None:
+        """Make rides take a bike from their start station, and return it
+        to their end station.
+
+        A ride still happens when its start station has no bikes or its end
+        station is full (the ride data is what really happened), but the
+        number of bikes of that station is then left unchanged, so that it
+        stays between 0 and the station's capacity.
+        """
+        self.track_occupancy = True
+        self._handlers[KIND_RIDE_START] = self._start_ride_tracked
+        self._handlers[KIND_RIDE_END] = self._end_ride_tracked
+
+    def add_occupancy_listener(self, listener: Callable[[Station], None]) \
+            -> None:
+        """Call <listener> with each station whose number of bikes changes,
+        right after it changes.
+        """
+        self._occupancy_listeners.append(listener)
+
+    def occupancy_changed(self, station: Station) -> None:
+        """Notify the occupancy listeners that the number of bikes at
+        <station> changed.
+
+        Anything that changes Station.num_bikes during a run must call this.
+        """
+        for listener in self._occupancy_listeners:
+            listener(station)
+
+    def add_reset_listener(self, listener: Callable[[], None]) -> None:
+        """Call <listener> at the end of every reset, after the event queue
+        was emptied.
+
+        Anything that keeps state about the events it scheduled must
+        discard that state then.
+        """
+        self._reset_listeners.append(listener)
+
+    def add_start_listener(self, listener: Callable[[int], None]) -> None:
+        """Call <listener> with the first minute of every run, before any
+        event of the run is processed.
+
+        Events scheduled by <listener> at the current minute are processed
+        in the first minute of the run.
         """
-        self.all_stations = create_stations(station_file)
-        self.all_rides = create_rides(ride_file, self.all_stations)
-        self.visualizer = Visualizer()
-        self.active_rides = []
-        self.ride_priority_queue = PriorityQueue()
+        self._start_listeners.append(listener)
 
-    def run(self, start: datetime, end: datetime) -> None:
+    def add_tick_listener(self, listener: Callable[[int], None]) -> None:
+        """Call <listener> with the current minute at the end of every
+        minute of a run, once all of that minute's events are processed.
+        """
+        self._tick_listeners.append(listener)
+
+    def add_ride_end_listener(self, listener: Callable[[Ride], None]) \
+            -> None:
+        """Call <listener> with every ride that ends, right after it ends.
+        """
+        self._ride_end_listeners.append(listener)
+
+    def ride_ended(self, ride: Ride) -> None:
+        """Notify the ride end listeners that <ride> ended."""
+        for listener in self._ride_end_listeners:
+            listener(ride)
+
+    def enable_trip_statistics(self, k: int = 200) -> None:
+        """Keep quantile sketches of the durations and distances of the
+        trips that end, with size parameter <k>, in self.trip_sketches.
+
+        See calculate_trip_statistics. Calling this again replaces the
+        sketches with empty ones.
+        """
+        from sketches import TripSketches
+        if self.trip_sketches is None:
+            self.add_ride_end_listener(self._add_trip)
+        self.trip_sketches = TripSketches(k)
+
+    def _add_trip(self, ride: Ride) -> None:
+        """Add the trip of <ride> to self.trip_sketches."""
+        self.trip_sketches.add_ride(ride)
+
+    def register_event_kind(self, handler: Callable[[int], None]) -> int:
+        """Register a new kind of event processed by <handler>, and return
+        the kind to use when scheduling events of that kind.
+
+        <handler> is called with the index of each event of that kind, when
+        the simulation reaches the time of the event.
+        """
+        self._handlers.append(handler)
+        return len(self._handlers) - 1
+
+    def schedule(self, time: int, kind: int, index: int) -> None:
+        """Add an event of the given <kind> and <index> to the event queue,
+        to happen at <time> (in minutes since EPOCH).
+        """
+        self.ride_priority_queue.add((time, next(self._sequence), kind,
+                                      index))
+
+    def schedule_event(self, event: 'Event') -> None:
+        """Add the Event object <event> to the event queue.
+
+        This is the extension point for new kinds of events that are
+        easier to write as Event subclasses; rides themselves are
+        scheduled as tuples.
+        """
+        sequence = next(self._sequence)
+        self._pending_events[sequence] = event
+        self.ride_priority_queue.add((event.time, sequence, KIND_EVENT,
+                                      sequence))
+
+    def _start_ride(self, index: int) -> None:
+        """Start the ride at position <index> of self.all_rides."""
+        ride = self.all_rides[index]
+        self.active_rides[ride] = ride
+        ride.start.num_bikes_start += 1
+        self.schedule(ride.end_minute, KIND_RIDE_END, index)
+
+    def _end_ride(self, index: int) -> None:
+        """End the ride at position <index> of self.all_rides."""
+        ride = self.all_rides[index]
+        del self.active_rides[ride]
+        ride.end.num_bikes_end += 1
+        if self._ride_end_listeners:
+            self.ride_ended(ride)
+
+    def _start_ride_tracked(self, index: int) -> None:
+        """Start the ride at position <index> of self.all_rides, taking a
+        bike from its start station.
+        """
+        self._start_ride(index)
+        station = self.all_rides[index].start
+        if station.num_bikes > 0:
+            station.num_bikes -= 1
+            self.occupancy_changed(station)
+
+    def _end_ride_tracked(self, index: int) -> None:
+        """End the ride at position <index> of self.all_rides, returning
+        its bike to its end station.
+        """
+        self._end_ride(index)
+        station = self.all_rides[index].end
+        if station.num_bikes < station.capacity:
+            station.num_bikes += 1
+            self.occupancy_changed(station)
+
+    def _process_event(self, sequence: int) -> None:
+        """Process the Event object with the given sequence number, and
+        schedule the events it spawns.
+        """
+        for event in self._pending_events.pop(sequence).process():
+            self.schedule_event(event)
+
+    def start_events(self, start: datetime, end: datetime) -> List[Tuple]:
+        """Return the events that start the rides of a run from <start> to
+        <end>, sorted in the order they happen.
+
+        The result only depends on self.all_rides, so it can be computed
+        once and passed to run for every simulation over the same rides.
+        Start events use negative sequence numbers, in the order of
+        self.all_rides, so that they come before any other event of the
+        same minute.
+        """
+        first, bound, _ = _minute_window(start, end)
+        offset = len(self.all_rides)
+        return sorted((ride.start_minute, index - offset, KIND_RIDE_START,
+                       index)
+                      for index, ride in enumerate(self.all_rides)
+                      if first < ride.start_minute < bound)
+
+    def run(self, start: datetime, end: datetime,
+            events: Optional[List[Tuple]] = None) -> None:
         """Run the simulation from <start> to <end>.
+
+        <events> are the start events of the run, as returned by
+        start_events(start, end). They are computed when not given.
         """
         step = timedelta(minutes=1)  # Each iteration spans one minute of time
 
-        time = start
+        first, _, ticks = _minute_window(start, end)
 
-        for ride in self.all_rides:
-            if start < ride.start_time < end:
-                self.ride_priority_queue.add(RideStartEvent(self,
-                                                            ride.start_time,
-                                                            ride))
+        profile = self.profile
+
+        if profile is not None:
+            profile.start_run()
+            started = profile.clock()
 
-        while time < end:
-            time += step
+        if events is None:
+            events = self.start_events(start, end)
+        self.ride_priority_queue.extend(events)
 
+        self.current_minute = first
+        for listener in self._start_listeners:
+            listener(first)
+
+        if profile is not None:
+            started = profile.record('queue', started)
+
+        for tick in range(1, ticks + 1):
             for station in self.all_stations:
                 self.all_stations[station].check_space()
 
-            self._update_active_rides_fast(time)
+            if profile is not None:
+                started = profile.record('check_space', started)
+                depth = len(self.ride_priority_queue)
+
+            self.current_minute = first + tick
+            events = self._process_events(self.current_minute)
 
-            rides_stations = list(
-                self.all_stations.values()) + self.active_rides
+            if profile is not None:
+                started = profile.record('queue', started)
+                profile.record_tick(events, depth, len(self.active_rides))
 
-            self.visualizer.render_drawables(rides_stations, time)
+            for listener in self._tick_listeners:
+                listener(self.current_minute)
+
+            if profile is not None:
+                started = profile.record('listeners', started)
+
+            if self.visualizer is not None:
+                rides_stations = list(self.all_stations.values()) + \
+                    list(self.active_rides)
+
+                self.visualizer.render_drawables(rides_stations,
+                                                 start + tick * step)
+
+                if profile is not None:
+                    started = profile.record('render', started)
 
             # This part was commented out to allow sample tests to work
             # if self.visualizer.handle_window_events():
             #     return  # Stop the simulation
 
+        if profile is not None:
+            profile.end_run()
+
     def _update_active_rides(self, time: datetime) -> None:
         """Update this simulation's list of active rides for the given time.
 
@@ -107,64 +443,45 @@ class Simulation:
             period but ends during or after the simulation's time period,
             it should still be added to self.active_rides.
         """
+        time = to_minutes(time)
 
         for ride in self.all_rides:
             # Only take into account ride that happen during the simulation
             # bracket
-            if (ride.start_time <= time <= ride.end_time) and \
+            if (ride.start_minute <= time <= ride.end_minute) and \
                     (ride not in self.active_rides):
-                self.active_rides.append(ride)
+                self.active_rides[ride] = ride
                 ride.start.num_bikes_start += 1
 
-        for ride in self.active_rides:
+        for ride in list(self.active_rides):
             # Remove a ride from active rides if the ride is over
-            if time > ride.end_time:
-                self.active_rides.remove(ride)
+            if time > ride.end_minute:
+                del self.active_rides[ride]
                 ride.end.num_bikes_end += 1
 
-        for ride in self.active_rides:
+        for ride in list(self.active_rides):
             # If a ride starts, remove a bike from its start station
-            if time == ride.start_time:
+            if time == ride.start_minute:
                 if ride.start.num_bikes > 0:
                     ride.start.num_bikes -= 1
                 else:
-                    self.active_rides.remove(ride)
+                    del self.active_rides[ride]
+                    continue
 
             # If a ride is over, add a bike to its en station and remove it
             # from active rides
-            if time == ride.end_time:
+            if time == ride.end_minute:
                 if ride.end.capacity > ride.end.num_bikes:
                     ride.end.num_bikes += 1
                 else:
-                    self.active_rides.remove(ride)
+                    del self.active_rides[ride]
 
     def _find_max(self, value: str):
         """Helper function to find the stations with the maximum of the queried
         attribute
         """
-        stations = self.all_stations
-        maximum = ('', -1)
-
-        for key in stations:
-            # Adapt the attribute search for according to the queried one
-            if value == 'num_bikes_start':
-                station_attribute = stations[key].num_bikes_start
-            elif value == 'num_bikes_end':
-                station_attribute = stations[key].num_bikes_end
-            elif value == 'total_time_low_availability':
-                station_attribute = stations[key].total_time_low_availability
-            elif value == 'total_time_low_unoccupied':
-                station_attribute = stations[key].total_time_low_unoccupied
-
-            # Find maximum value by replacing maximum if the station has a
-            # higher value
-            if station_attribute > maximum[1]:
-                maximum = (stations[key].name, station_attribute)
-            elif station_attribute == maximum[1]:
-                if stations[key].name < maximum[0]:
-                    maximum = (stations[key].name, station_attribute)
-
-        return maximum
+        return find_max((station.name, getattr(station, value))
+                        for station in self.all_stations.values())
 
     def calculate_statistics(self) -> Dict[str, Tuple[str, float]]:
         """Return a dictionary containing statistics for this simulation.
@@ -200,6 +517,20 @@ class Simulation:
             'max_time_low_unoccupied': max_time_low_unoccupied
         }
 
+    def calculate_trip_statistics(self) -> Dict[str, Dict]:
+        """Return the number of trips and the estimated median and 95th
+        percentile of the trip durations (in minutes) and distances (in km)
+        of each station, keyed by station name, as returned by
+        TripSketches.summary.
+
+        Only the trips that ended since enable_trip_statistics was called
+        are included, and only stations with at least one such trip have a
+        value.
+        """
+        if self.trip_sketches is None:
+            return {}
+        return self.trip_sketches.summary()
+
     def _update_active_rides_fast(self, time: datetime) -> None:
         """Update this simulation's list of active rides for the given
         time.
@@ -207,16 +538,55 @@ class Simulation:
         REQUIRED IMPLEMENTATION NOTES:
         -   see Task 5 of the assignment handout
         """
+        self._process_events(to_minutes(time))
+
+    def _process_events(self, time: int) -> int:
+        """Process the events of the queue up to the given time, in minutes
+        since EPOCH, and return the number of events processed.
+        """
         p_queue = self.ride_priority_queue
-        while not p_queue.is_empty():
-            event = p_queue.remove()
-            if time < event.time:
-                p_queue.add(event)
-                return
-            else:
-                queued_events = event.process()
-                for queued_event in queued_events:
-                    p_queue.add(queued_event)
+        handlers = self._handlers
+        processed = 0
+        while not p_queue.is_empty() and p_queue.next_time() <= time:
+            _, _, kind, index = p_queue.remove()
+            handlers[kind](index)
+            processed += 1
+        return processed
+
+
+def find_max(values: Iterable[Tuple[str, float]]) -> Tuple[str, float]:
+    """Return the (name, value) pair of <values> with the largest value.
+
+    Ties are broken by taking the smallest name. Return ('', -1) if
+    <values> is empty.
+
+    >>> find_max([('b', 3), ('c', 1), ('a', 3)])
+    ('a', 3)
+    """
+    maximum = ('', -1)
+    for name, value in values:
+        # Find maximum value by replacing maximum if the station has a
+        # higher value
+        if value > maximum[1]:
+            maximum = (name, value)
+        elif value == maximum[1]:
+            if name < maximum[0]:
+                maximum = (name, value)
+    return maximum
+
+
+def _minute_window(start: datetime, end: datetime) -> Tuple[int, int, int]:
+    """Return the (first, bound, ticks) of a run from <start> to <end>.
+
+    The engine works in whole minutes since EPOCH. The run has <ticks>
+    iterations, and the i-th iteration processes the events up to minute
+    first + i, which is the same as comparing them to start + i minutes.
+    Rides in the run start strictly between first and bound; <end> is
+    rounded up to the next whole minute for this.
+    """
+    step = timedelta(minutes=1)
+    return (to_minutes(start), -((EPOCH - end) // step),
+            -((start - end) // step))
 
 
 def create_stations(stations_file: str) -> Dict[str, 'Station']:
@@ -281,33 +651,93 @@ def create_rides(rides_file: str,
             # constant we defined above. Example:
             # >>> datetime.strptime('2017-06-01 8:00', DATETIME_FORMAT)
             # datetime.datetime(2017, 6, 1, 8, 0)
+            #
+            # The engine only needs the times in minutes since EPOCH, which
+            # parse_minutes computes without building datetime objects.
 
             if line[1] in stations and line[3] in stations:
                 start_station = stations[line[1]]
                 end_station = stations[line[3]]
-                start_time = datetime.strptime(line[0], DATETIME_FORMAT)
-                end_time = datetime.strptime(line[2], DATETIME_FORMAT)
+                start_time = parse_minutes(line[0])
+                end_time = parse_minutes(line[2])
 
-                rides.append(Ride(start_station, end_station,
-                                  (start_time, end_time)))
+                rides.append(Ride.from_minute_range(
+                    start_station, end_station, (start_time, end_time)))
 
     return rides
 
 
+def station_index(stations: Dict[str, 'Station']) -> Dict[str, int]:
+    """Return a dense index for <stations>: a dictionary mapping each
+    station id to a distinct int from 0 to len(stations) - 1.
+
+    The index follows the order of <stations>, which for the dictionaries
+    returned by create_stations is the order of the stations file.
+    """
+    return {station_id: index for index, station_id in enumerate(stations)}
+
+
+def read_ride_records(rides_file: str, index: Dict[str, int]) \
+        -> Iterator[Tuple[int, int, int, int]]:
+    """Yield the rides described in the given CSV file, one at a time, as
+    (start time, start station, end time, end station) tuples.
+
+    Times are in minutes since EPOCH and stations are given by their
+    position in <index> (see station_index). As in create_rides, rides
+    whose start or end station is not in <index> are ignored.
+
+    Unlike create_rides, this never holds more than one ride in memory.
+    """
+    with open(rides_file) as file:
+        for line in csv.reader(file):
+            start_station = index.get(line[1])
+            end_station = index.get(line[3])
+            if start_station is not None and end_station is not None:
+                yield (parse_minutes(line[0]), start_station,
+                       parse_minutes(line[2]), end_station)
+
+
+def parse_minutes(text: str) -> int:
+    """Return the time <text>, in DATETIME_FORMAT, as a number of minutes
+    since EPOCH.
+
+    Dates are parsed once and cached, so this is much faster than
+    datetime.strptime on files with many rides per day.
+
+    >>> parse_minutes('1970-01-02 0:01')
+    1441
+    >>> parse_minutes('1970-01-02 1:05') == parse_minutes('1970-01-02 01:05')
+    True
+    """
+    date, clock = text.split(' ')
+    day = _DAY_MINUTES.get(date)
+    if day is None:
+        day = to_minutes(datetime.strptime(date, DATE_FORMAT))
+        _DAY_MINUTES[date] = day
+    hours, minutes = clock.split(':')
+    return day + int(hours) * 60 + int(minutes)
+
+
 class Event:
     """An event in the bike share simulation.
 
     Events are ordered by their timestamp.
+
+    The engine itself encodes rides as tuples in its event queue (see
+    KIND_RIDE_START and KIND_RIDE_END). Event objects added with
+    Simulation.schedule_event are still processed in time order along with
+    them, so subclasses remain a simple way to add new kinds of events.
+
     === Attributes ===
     simulation:
         The simulation that the event happens in
     time:
-        The time that the event happens
+        The time that the event happens, in minutes since EPOCH
     """
     simulation: 'Simulation'
-    time: datetime
+    time: int
 
-    def __init__(self, simulation: 'Simulation', time: datetime) -> None:
+    def __init__(self, simulation: 'Simulation', time: int) -> None:
         """Initialize a new event."""
         self.simulation = simulation
         self.time = time
@@ -336,7 +766,7 @@ class RideStartEvent(Event):
         The ride that is starting when this event is called
     """
 
-    def __init__(self, simulation: 'Simulation', time: datetime, ride: 'Ride') \
+    def __init__(self, simulation: 'Simulation', time: int, ride: 'Ride') \
             -> None:
         """Initialize a new event."""
         Event.__init__(self, simulation, time)
@@ -344,9 +774,10 @@ class RideStartEvent(Event):
 
     def process(self) -> List['Event']:
         """Function that processes the event"""
-        self.simulation.active_rides.append(self.ride)
+        self.simulation.active_rides[self.ride] = self.ride
         self.ride.start.num_bikes_start += 1
-        return [RideEndEvent(self.simulation, self.ride.end_time, self.ride)]
+        return [RideEndEvent(self.simulation, self.ride.end_minute,
+                             self.ride)]
 
 
 class RideEndEvent(Event):
@@ -358,7 +789,7 @@ class RideEndEvent(Event):
         The ride that is ending when this event is called
     """
 
-    def __init__(self, simulation: 'Simulation', time: datetime, ride: 'Ride') \
+    def __init__(self, simulation: 'Simulation', time: int, ride: 'Ride') \
             -> None:
         """Initialize a new event."""
         Event.__init__(self, simulation, time)
@@ -366,8 +797,9 @@ class RideEndEvent(Event):
 
     def process(self) -> List['Event']:
         """Function that processes the event"""
-        self.simulation.active_rides.remove(self.ride)
+        del self.simulation.active_rides[self.ride]
         self.ride.end.num_bikes_end += 1
+        self.simulation.ride_ended(self.ride)
         return []
 
 
@@ -387,7 +819,7 @@ if __name__ == '__main__':
     #     'allowed-import-modules': [
     #         'doctest', 'python_ta', 'typing',
     #         'csv', 'datetime', 'json',
-    #         'bikeshare', 'container', 'visualizer'
+    #         'bikeshare', 'container', 'profiling', 'visualizer'
     #     ]
     # })
     print(sample_simulation())
@@ -0,0 +1,232 @@
+"""Assignment 1 - Trip quantile sketches
+
+=== Module Description ===
+
+This file contains the KLLSketch class, a streaming quantile sketch, and
+the TripSketches class, which keeps one sketch of the trip durations and
+one of the trip distances for each station.
+
+A KLL sketch keeps a small, bounded sample of the values added to it, each
+standing for a power of two of the original values. When the sample is
+full, the values of one level are sorted and every second one is promoted
+to the next level, with twice the weight. The memory used only depends on
+the parameter k, not on the number of values, and the rank error of a
+quantile is about 1 / k. Two sketches can be merged into a sketch of all
+their values, so sketches built by parallel runs can be combined.
+
+The distance of a trip is the distance between its start and end stations
+(see bikeshare.distance), in km, and its duration is in minutes. Trips are
+counted at the station where they start.
+"""
+import random
+from typing import Dict, List, Optional
+
+from bikeshare import Ride, distance
+
+# The default size parameter of the sketches
+DEFAULT_K = 200
+
+# The quantiles reported by TripSketches.summary
+QUANTILES = [0.5, 0.95]
+
+
+class KLLSketch:
+    """A mergeable streaming quantile sketch.
+
+    === Attributes ===
+    k:
+        the size parameter: the capacity of the top level
+    count:
+        the number of values added to this sketch
+    minimum:
+        the smallest value added, or None if there is none
+    maximum:
+        the largest value added, or None if there is none
+
+    === Representation Invariants ===
+    - k >= 2
+    """
+    k: int
+    count: int
+    minimum: Optional[float]
+    maximum: Optional[float]
+
+    # === Private attributes ===
+    # _levels: the values kept at each level; a value at level h stands for
+    #   2 ** h values.
+    # _size: the number of values kept over all levels.
+    # _limit: the number of values the levels can hold in total.
+    # _random: the source of the coin flips of the compactions.
+    _levels: List[List[float]]
+    _size: int
+    _limit: int
+    _random: random.Random
+
+    def __init__(self, k: int = DEFAULT_K, seed: int = 0) -> None:
+        """Initialize an empty sketch."""
+        self.k = k
+        self.count = 0
+        self.minimum = None
+        self.maximum = None
+        self._levels = []
+        self._size = 0
+        self._add_level()
+        self._random = random.Random(seed)
+
+    def __len__(self) -> int:
+        """Return the number of values kept by this sketch."""
+        return self._size
+
+    def _capacity(self, level: int) -> int:
+        """Return the number of values that <level> can hold."""
+        depth = len(self._levels) - level - 1
+        return max(2, int(self.k * (2 / 3) ** depth))
+
+    def _add_level(self) -> None:
+        """Add an empty level on top of the others."""
+        self._levels.append([])
+        self._limit = sum(self._capacity(level)
+                          for level in range(len(self._levels)))
+
+    def add(self, value: float) -> None:
+        """Add <value> to this sketch."""
+        self._levels[0].append(value)
+        self._size += 1
+        self.count += 1
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+        if self._size >= self._limit:
+            self._compress()
+
+    def _compress(self) -> None:
+        """Compact the lowest full level, halving its values into the next
+        level.
+        """
+        for level, values in enumerate(self._levels):
+            if len(values) >= self._capacity(level):
+                if level + 1 == len(self._levels):
+                    self._add_level()
+                values.sort()
+                # An odd value out stays, so that no weight is lost
+                kept = values[-1:] if len(values) % 2 else []
+                compacted = values[:len(values) - len(kept)]
+                promoted = compacted[self._random.randrange(2)::2]
+                self._levels[level + 1].extend(promoted)
+                self._size += len(promoted) - len(compacted)
+                values[:] = kept
+                return
+
+    def merge(self, other: 'KLLSketch') -> None:
+        """Add all the values of <other> to this sketch.
+
+        <other> is left unchanged.
+        """
+        while len(self._levels) < len(other._levels):
+            self._add_level()
+        for level, values in enumerate(other._levels):
+            self._levels[level].extend(values)
+        self._size += other._size
+        self.count += other.count
+        for value in (other.minimum, other.maximum):
+            if value is not None:
+                if self.minimum is None or value < self.minimum:
+                    self.minimum = value
+                if self.maximum is None or value > self.maximum:
+                    self.maximum = value
+        while self._size >= self._limit:
+            self._compress()
+
+    def quantile(self, fraction: float) -> Optional[float]:
+        """Return an estimate of the value with the given <fraction> of the
+        values at or below it, or None if the sketch is empty.
+
+        >>> sketch = KLLSketch()
+        >>> for value in range(1, 101):
+        ...     sketch.add(value)
+        >>> sketch.quantile(0.5), sketch.quantile(1)
+        (50, 100)
+        """
+        if self.count == 0:
+            return None
+        if fraction <= 0:
+            return self.minimum
+        if fraction >= 1:
+            return self.maximum
+        weighted = sorted((value, 1 << level)
+                          for level, values in enumerate(self._levels)
+                          for value in values)
+        total = sum(weight for _, weight in weighted)
+        target = fraction * total
+        seen = 0
+        for value, weight in weighted:
+            seen += weight
+            if seen >= target:
+                return value
+        return self.maximum
+
+
+class TripSketches:
+    """Quantile sketches of the trip durations and distances of each
+    station.
+
+    === Attributes ===
+    k:
+        the size parameter of the sketches
+    durations:
+        the sketch of the durations of the trips from each station, in
+        minutes, keyed by station name
+    distances:
+        the sketch of the distances of the trips from each station, in km,
+        keyed by station name
+    """
+    k: int
+    durations: Dict[str, KLLSketch]
+    distances: Dict[str, KLLSketch]
+
+    def __init__(self, k: int = DEFAULT_K) -> None:
+        """Initialize empty sketches."""
+        self.k = k
+        self.durations = {}
+        self.distances = {}
+
+    def clear(self) -> None:
+        """Forget all the trips."""
+        self.durations = {}
+        self.distances = {}
+
+    def add_ride(self, ride: Ride) -> None:
+        """Add the trip of <ride>."""
+        name = ride.start.name
+        if name not in self.durations:
+            self.durations[name] = KLLSketch(self.k)
+            self.distances[name] = KLLSketch(self.k)
+        self.durations[name].add(ride.end_minute - ride.start_minute)
+        self.distances[name].add(distance(ride.start.location,
+                                          ride.end.location))
+
+    def merge(self, other: 'TripSketches') -> None:
+        """Add all the trips of <other> to these sketches."""
+        for mine, theirs in ((self.durations, other.durations),
+                             (self.distances, other.distances)):
+            for name, sketch in theirs.items():
+                if name not in mine:
+                    mine[name] = KLLSketch(self.k)
+                mine[name].merge(sketch)
+
+    def summary(self, quantiles: List[float] = None) -> Dict[str, Dict]:
+        """Return the number of trips and the estimated quantiles of the
+        trip durations and distances of each station, keyed by station name.
+
+        Each value is a dictionary with the keys 'trips', 'duration' and
+        'distance'; the last two map to a tuple with the estimate of each of
+        <quantiles> (by default, QUANTILES), in order.
+        """
+        quantiles = quantiles or QUANTILES
+        return {name: {
+            'trips': sketch.count,
+            'duration': tuple(sketch.quantile(q) for q in quantiles),
+            'distance': tuple(self.distances[name].quantile(q)
+                              for q in quantiles)}
+                for name, sketch in self.durations.items()}
@@ -0,0 +1,273 @@
+"""Assignment 1 - Stochastic demand
+
+=== Module Description ===
+
+This file contains the DemandModel class, which estimates how many rides
+start at each station in each hour of the day from historical ride files,
+and samples new rides from those rates instead of replaying the history.
+
+The number of rides starting at a station in an hour follows a Poisson
+distribution with the historical mean for that station and hour. The
+destination of each ride is drawn from the destinations of the historical
+rides from the same station, and its duration from the durations of the
+historical rides between the same two stations, or from the same station
+when there are too few of those. Durations are kept as histograms of whole
+minutes, so the size of a model does not grow with the length of the
+history.
+
+replicate runs many simulations, each on its own sample of rides, and
+summarizes the statistics of Simulation.calculate_statistics over all of
+them. Each replication has its own seed derived from the base seed and its
+number, so results do not depend on how replications are spread over the
+worker processes.
+"""
+import bisect
+from collections import Counter
+from datetime import datetime
+import math
+from multiprocessing import Pool
+import random
+from typing import Dict, List, Optional, Tuple
+
+from bikeshare import Ride, Station, to_minutes
+from simulation import (Simulation, create_stations, read_ride_records,
+                        station_index)
+
+# Means above this are sampled with a normal approximation of the Poisson
+# distribution, which is much faster
+POISSON_NORMAL_LIMIT = 30.0
+
+# The minimum number of historical rides between two stations for the
+# durations of a sampled ride to be drawn from those rides alone
+MIN_PAIR_SAMPLES = 5
+
+# The percentiles reported by replicate
+PERCENTILES = [5, 50, 95]
+
+# The model and stations file of the current worker process, set by
+# _load_model
+_worker = None
+
+
+class DemandModel:
+    """Per-station, per-hour ride demand estimated from history.
+
+    === Attributes ===
+    station_ids:
+        the ids of the stations, in the order of their dense index
+    rates:
+        the mean number of rides per day starting at each station in each
+        hour, keyed by (station index, hour of the day)
+    destinations:
+        for each station index with at least one ride, the indexes of the
+        destinations of its rides and their cumulative counts
+    durations:
+        for each station index with at least one ride, the distinct
+        durations of its rides in minutes and their cumulative counts
+    pair_durations:
+        for each (origin, destination) pair of station indexes with at
+        least MIN_PAIR_SAMPLES rides, the distinct durations of those rides
+        in minutes and their cumulative counts
+    """
+    station_ids: List[str]
+    rates: Dict[Tuple[int, int], float]
+    destinations: Dict[int, Tuple[List[int], List[int]]]
+    durations: Dict[int, Tuple[List[int], List[int]]]
+    pair_durations: Dict[Tuple[int, int], Tuple[List[int], List[int]]]
+
+    def __init__(self, stations_file: str, rides_files: List[str]) -> None:
+        """Estimate the demand from the rides in <rides_files>.
+
+        The rates are averaged over the days on which at least one ride
+        starts.
+        """
+        index = station_index(create_stations(stations_file))
+        self.station_ids = list(index)
+
+        starts = Counter()
+        trips = {}
+        pairs = {}
+        days = set()
+        for rides_file in rides_files:
+            for start, origin, end, destination in \
+                    read_ride_records(rides_file, index):
+                day, minute = divmod(start, 24 * 60)
+                days.add(day)
+                starts[(origin, minute // 60)] += 1
+                trips.setdefault(origin, Counter())[destination] += 1
+                pairs.setdefault((origin, destination),
+                                 Counter())[end - start] += 1
+
+        num_days = max(len(days), 1)
+        self.rates = {key: count / num_days for key, count in starts.items()}
+        self.destinations = {origin: _cumulative(counts)
+                             for origin, counts in trips.items()}
+        by_origin = {}
+        self.pair_durations = {}
+        for pair, counts in pairs.items():
+            by_origin.setdefault(pair[0], Counter()).update(counts)
+            if sum(counts.values()) >= MIN_PAIR_SAMPLES:
+                self.pair_durations[pair] = _cumulative(counts)
+        self.durations = {origin: _cumulative(counts)
+                          for origin, counts in by_origin.items()}
+
+    def sample(self, stations: Dict[str, Station], start: datetime,
+               end: datetime, rng: random.Random) -> List[Ride]:
+        """Return a random sample of the rides starting in the whole days
+        from <start> to <end>, between <stations>.
+
+        <stations> must be the stations of the file this model was
+        estimated from.
+        """
+        by_index = [stations[station_id] for station_id in self.station_ids]
+        first_day = to_minutes(start) // (24 * 60)
+        last_day = -(-to_minutes(end) // (24 * 60))
+
+        rides = []
+        for day in range(first_day, last_day):
+            for (origin, hour), rate in self.rates.items():
+                hour_start = (day * 24 + hour) * 60
+                destinations = self.destinations[origin]
+                for _ in range(_poisson(rng, rate)):
+                    ride_start = hour_start + rng.randrange(60)
+                    target = _draw(rng, destinations)
+                    durations = self.pair_durations.get(
+                        (origin, target), self.durations[origin])
+                    duration = max(1, _draw(rng, durations))
+                    rides.append(Ride.from_minute_range(
+                        by_index[origin], by_index[target],
+                        (ride_start, ride_start + duration)))
+        rides.sort(key=lambda ride: ride.start_minute)
+        return rides
+
+
+def _cumulative(counts: Counter) -> Tuple[List[int], List[int]]:
+    """Return the values of <counts>, sorted, and their cumulative counts.
+
+    >>> _cumulative(Counter({3: 2, 1: 1}))
+    ([1, 3], [1, 3])
+    """
+    values = sorted(counts)
+    cumulative = []
+    total = 0
+    for value in values:
+        total += counts[value]
+        cumulative.append(total)
+    return values, cumulative
+
+
+def _draw(rng: random.Random, table: Tuple[List[int], List[int]]) -> int:
+    """Return a random value of <table>, as returned by _cumulative, with
+    the probability of its count.
+    """
+    values, cumulative = table
+    return values[bisect.bisect(cumulative, rng.randrange(cumulative[-1]))]
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    """Return a random number of events of a Poisson process with the
+    given mean.
+    """
+    if mean > POISSON_NORMAL_LIMIT:
+        return max(0, round(rng.gauss(mean, math.sqrt(mean))))
+    # Knuth's algorithm
+    limit = math.exp(-mean)
+    count = 0
+    product = rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def run_replication(model: DemandModel, stations_file: str, start: datetime,
+                    end: datetime, seed: int, replication: int) \
+        -> Dict[str, Tuple[str, float]]:
+    """Return the statistics of one simulation from <start> to <end> on
+    rides sampled from <model>.
+
+    The sample only depends on <seed> and <replication>.
+    """
+    rng = random.Random('{}:{}'.format(seed, replication))
+    stations = create_stations(stations_file)
+    rides = model.sample(stations, start, end, rng)
+    sim = Simulation.from_objects(stations, rides)
+    sim.run(start, end)
+    return sim.calculate_statistics()
+
+
+def _load_model(model: DemandModel, stations_file: str) -> None:
+    """Keep the model of a replication study in a worker process."""
+    global _worker
+    _worker = (model, stations_file)
+
+
+def _replicate_job(job: Tuple[datetime, datetime, int, int]) \
+        -> Dict[str, Tuple[str, float]]:
+    """Run one replication in a worker process."""
+    model, stations_file = _worker
+    return run_replication(model, stations_file, *job)
+
+
+def replicate(model: DemandModel, stations_file: str, start: datetime,
+              end: datetime, replications: int, seed: int = 0,
+              processes: Optional[int] = None) -> Dict[str, Dict]:
+    """Run <replications> simulations from <start> to <end> on rides
+    sampled from <model>, and return a summary of their statistics.
+
+    Replications run in a pool of <processes> worker processes (by
+    default, one per CPU); with processes=1 they run in this process.
+
+    The summary has the keys of Simulation.calculate_statistics. Each value
+    is a dictionary with the mean of the statistic's value, its percentiles
+    (keyed 'p5', 'p50' and 'p95'), and the station that had the maximum
+    most often together with how many replications it did so in.
+    """
+    jobs = [(start, end, seed, replication)
+            for replication in range(replications)]
+    if processes == 1:
+        _load_model(model, stations_file)
+        results = [_replicate_job(job) for job in jobs]
+    else:
+        with Pool(processes, _load_model, (model, stations_file)) as pool:
+            results = pool.map(_replicate_job, jobs)
+    return summarize(results)
+
+
+def summarize(results: List[Dict[str, Tuple[str, float]]]) \
+        -> Dict[str, Dict]:
+    """Return the summary of the statistics of several simulations, as
+    described in replicate.
+
+    >>> summary = summarize([{'max_start': ('a', 1)},
+    ...                      {'max_start': ('b', 3)},
+    ...                      {'max_start': ('a', 2)}])
+    >>> summary['max_start']['mean'], summary['max_start']['p50']
+    (2.0, 2.0)
+    >>> summary['max_start']['station']
+    ('a', 2)
+    """
+    summary = {}
+    for key in (results[0] if results else {}):
+        values = sorted(result[key][1] for result in results)
+        names = Counter(result[key][0] for result in results)
+        stats = {'mean': sum(values) / len(values)}
+        for percent in PERCENTILES:
+            stats['p{}'.format(percent)] = _percentile(values, percent)
+        stats['station'] = names.most_common(1)[0]
+        summary[key] = stats
+    return summary
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    """Return the <percent>-th percentile of the sorted <values>, linearly
+    interpolated between the closest ranks.
+
+    >>> _percentile([1, 2, 3, 4], 50)
+    2.5
+    """
+    position = (len(values) - 1) * percent / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * \
+        (position - lower)
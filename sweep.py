@@ -0,0 +1,139 @@
+"""Assignment 1 - Capacity sweeps
+
+=== Module Description ===
+
+This file contains the functions used to evaluate many what-if
+configurations of the stations over the same rides, for example when
+studying how to rebalance bikes.
+
+A configuration overrides the capacity and the initial number of bikes of
+some stations; every other station keeps the values from the stations file.
+The stations and rides files are parsed once, and the sorted start events of
+the run are computed once and shared by every configuration. With more than
+one process, each worker process parses the data once and then evaluates
+its share of the configurations.
+
+By default, rides do not move bikes (see
+Simulation.enable_occupancy_tracking), so the number of bikes at each
+station stays at its initial value: overrides then only change the
+availability statistics. Sweeps with track=True move bikes with the rides,
+as a rebalancing study needs.
+"""
+from datetime import datetime
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Tuple
+
+from simulation import Simulation, create_rides, create_stations
+
+# A configuration: station id -> (capacity, initial number of bikes)
+Overrides = Dict[str, Tuple[int, int]]
+
+# The dataset of the current process, set by _load_dataset
+_dataset = None
+
+
+class SweepDataset:
+    """A parsed dataset, shared by all the configurations of a sweep.
+
+    === Attributes ===
+    simulation:
+        the headless simulation that every configuration is run on
+    base:
+        the capacity and number of bikes of each station in the stations
+        file, keyed by station id
+    events:
+        the sorted start events of a run from start to end
+    start:
+        the start of the simulated period
+    end:
+        the end of the simulated period
+    track:
+        whether rides move bikes between stations
+    """
+    simulation: Simulation
+    base: Overrides
+    events: List[Tuple]
+    start: datetime
+    end: datetime
+    track: bool
+
+    def __init__(self, stations_file: str, rides_file: str,
+                 start: datetime, end: datetime,
+                 track: bool = False) -> None:
+        """Parse the given files for a sweep over the period from <start>
+        to <end>, with rides moving bikes if <track>.
+        """
+        stations = create_stations(stations_file)
+        rides = create_rides(rides_file, stations)
+        self.simulation = Simulation.from_objects(stations, rides)
+        if track:
+            self.simulation.enable_occupancy_tracking()
+        self.track = track
+        self.base = {station_id: (station.capacity, station.num_bikes)
+                     for station_id, station in stations.items()}
+        self.events = self.simulation.start_events(start, end)
+        self.start = start
+        self.end = end
+
+    def evaluate(self, overrides: Overrides) \
+            -> Dict[str, Tuple[str, float]]:
+        """Return the statistics of the simulation with the given
+        overrides, as returned by Simulation.calculate_statistics.
+
+        The occupancy listeners of the simulation are notified of each
+        overridden station after the reset, before the run starts.
+
+        Raise a ValueError if an override is for an unknown station, or
+        does not satisfy 0 <= num_bikes <= capacity.
+        """
+        sim = self.simulation
+        for station_id, (capacity, num_bikes) in overrides.items():
+            if station_id not in sim.all_stations:
+                raise ValueError('unknown station {}'.format(station_id))
+            if not 0 <= num_bikes <= capacity:
+                raise ValueError('invalid override for station {}: {} bikes '
+                                 'for a capacity of {}'.format(
+                                     station_id, num_bikes, capacity))
+
+        for station_id, station in sim.all_stations.items():
+            station.capacity, station.num_bikes = overrides.get(
+                station_id, self.base[station_id])
+        sim.reset()
+        for station_id in overrides:
+            sim.occupancy_changed(sim.all_stations[station_id])
+        sim.run(self.start, self.end, self.events)
+        return sim.calculate_statistics()
+
+
+def _load_dataset(stations_file: str, rides_file: str,
+                  start: datetime, end: datetime, track: bool) -> None:
+    """Parse the dataset of a sweep in a worker process."""
+    global _dataset
+    _dataset = SweepDataset(stations_file, rides_file, start, end, track)
+
+
+def _evaluate(overrides: Overrides) -> Dict[str, Tuple[str, float]]:
+    """Evaluate one configuration in a worker process."""
+    return _dataset.evaluate(overrides)
+
+
+def sweep(stations_file: str, rides_file: str, start: datetime,
+          end: datetime, configurations: List[Overrides],
+          processes: Optional[int] = 1, track: bool = False) \
+        -> List[Dict[str, Tuple[str, float]]]:
+    """Return the statistics of a simulation from <start> to <end> for each
+    of <configurations>, in the same order, with rides moving bikes between
+    stations if <track>.
+
+    With processes=1 (the default) everything runs in this process. With
+    more, or with None for one process per CPU, the configurations are
+    spread over a pool of worker processes.
+    """
+    if processes == 1:
+        dataset = SweepDataset(stations_file, rides_file, start, end,
+                               track)
+        return [dataset.evaluate(overrides) for overrides in configurations]
+
+    with Pool(processes, _load_dataset,
+              (stations_file, rides_file, start, end, track)) as pool:
+        return pool.map(_evaluate, configurations)
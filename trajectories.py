@@ -0,0 +1,274 @@
+"""Assignment 1 - Trajectory export
+
+=== Module Description ===
+
+This file contains the functions used to export the positions of many rides
+on a regular time grid, for example every 10 seconds of a day, to CSV,
+GeoJSON lines, or a binary columnar file.
+
+Positions are computed in batches: for each ride, the grid points within
+the ride are found with two divisions, and the positions at all of them are
+computed in one comprehension over the ride's start point and direction,
+with the same arithmetic as Ride.get_position. No datetime objects are
+created per position, and no method is called per ride and time.
+
+Positions are produced in chunks of whole rides with about chunk_rows rows
+each, as columns (see TrajectoryChunk), and every chunk is written before
+the next one is computed, so memory does not grow with the number of rides
+or the length of the grid.
+
+The columnar format (COLUMNAR_MAGIC) is a sequence of row groups, one per
+chunk: the number of rows, then the ride, time, longitude and latitude
+columns, all little-endian.
+"""
+from array import array
+import csv
+from datetime import datetime, timedelta
+from functools import lru_cache
+import json
+import struct
+import sys
+from typing import Callable, Dict, Iterable, Iterator, List
+
+from bikeshare import EPOCH, Ride
+
+# The default number of rows in a chunk
+CHUNK_ROWS = 65536
+
+# Identifies the files written by write_columnar
+COLUMNAR_MAGIC = b'TRJ1'
+
+# The format of the times in CSV and GeoJSON lines exports
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class TrajectoryChunk:
+    """The positions of some rides on a time grid, as columns.
+
+    === Attributes ===
+    rides:
+        the position of the ride of each row among the exported rides
+    times:
+        the time of each row, in seconds since EPOCH
+    longitudes:
+        the longitude of each row
+    latitudes:
+        the latitude of each row
+
+    === Representation Invariants ===
+    - all the columns have the same length
+    - the rows of a ride are contiguous and in increasing time order
+    """
+    rides: array
+    times: array
+    longitudes: array
+    latitudes: array
+
+    def __init__(self) -> None:
+        """Initialize an empty chunk."""
+        self.rides = array('q')
+        self.times = array('q')
+        self.longitudes = array('d')
+        self.latitudes = array('d')
+
+    def __len__(self) -> int:
+        """Return the number of rows in this chunk."""
+        return len(self.times)
+
+
+def grid_seconds(start: datetime, end: datetime, step: int) -> range:
+    """Return the times of the grid from <start> to <end> (inclusive) every
+    <step> seconds, in seconds since EPOCH.
+
+    >>> grid_seconds(datetime(1970, 1, 1), datetime(1970, 1, 1, 0, 1), 25)
+    range(0, 61, 25)
+    """
+    first = (start - EPOCH) // timedelta(seconds=1)
+    if (start - EPOCH) % timedelta(seconds=1):
+        first += 1
+    last = (end - EPOCH) // timedelta(seconds=1)
+    return range(first, last + 1, step)
+
+
+def iter_chunks(rides: Iterable[Ride], start: datetime, end: datetime,
+                step: int = 10, chunk_rows: int = CHUNK_ROWS) \
+        -> Iterator[TrajectoryChunk]:
+    """Yield the positions of <rides> at every time of the grid from
+    <start> to <end> every <step> seconds, in chunks.
+
+    A ride has a position at every time from its start time to its end time,
+    inclusive; a ride that ends in the minute it starts stays at its start
+    station. Rides are numbered in the order of <rides>, and are never
+    split between chunks.
+    """
+    grid = grid_seconds(start, end, step)
+    chunk = TrajectoryChunk()
+    for number, ride in enumerate(rides):
+        ride_start = ride.start_minute * 60
+        ride_end = ride.end_minute * 60
+        if not grid or ride_end < grid.start or ride_start >= grid.stop:
+            continue
+        # The first and last grid times within the ride
+        first = max(grid.start,
+                    grid.start - (grid.start - ride_start) // step * step)
+        last = min(grid[-1], ride_end - (ride_end - grid.start) % step)
+        if first > last:
+            continue
+
+        times = range(first, last + 1, step)
+        start_x, start_y = ride.start.location
+        end_x, end_y = ride.end.location
+        distance_x = end_x - start_x
+        distance_y = end_y - start_y
+        start_minute = ride.start_minute
+        span = ride.end_minute - start_minute
+        if span:
+            fractions = [(time / 60 - start_minute) / span
+                         for time in times]
+        else:
+            fractions = [0.0] * len(times)
+
+        chunk.rides.extend([number] * len(times))
+        chunk.times.extend(times)
+        chunk.longitudes.extend([start_x + distance_x * fraction
+                                 for fraction in fractions])
+        chunk.latitudes.extend([start_y + distance_y * fraction
+                                for fraction in fractions])
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = TrajectoryChunk()
+    if len(chunk):
+        yield chunk
+
+
+def write_csv(chunks: Iterable[TrajectoryChunk], path: str) -> int:
+    """Write <chunks> to a CSV file at <path> with one row per position,
+    and return the number of rows written.
+    """
+    rows = 0
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['ride', 'time', 'longitude', 'latitude'])
+        for chunk in chunks:
+            writer.writerows(zip(chunk.rides,
+                                 map(_format_time, chunk.times),
+                                 chunk.longitudes, chunk.latitudes))
+            rows += len(chunk)
+    return rows
+
+
+def write_geojsonl(chunks: Iterable[TrajectoryChunk], path: str) -> int:
+    """Write <chunks> to a GeoJSON lines file at <path> with one LineString
+    feature per ride, and return the number of positions written.
+
+    A ride with a single position is written as a Point, since a LineString
+    needs at least two.
+
+    The times of the positions are in the 'times' property of each feature.
+    """
+    rows = 0
+    with open(path, 'w') as file:
+        for chunk in chunks:
+            first = 0
+            while first < len(chunk):
+                number = chunk.rides[first]
+                last = first
+                while last < len(chunk) and chunk.rides[last] == number:
+                    last += 1
+                coordinates = [list(position) for position in zip(
+                    chunk.longitudes[first:last],
+                    chunk.latitudes[first:last])]
+                if len(coordinates) == 1:
+                    geometry = {'type': 'Point',
+                                'coordinates': coordinates[0]}
+                else:
+                    geometry = {'type': 'LineString',
+                                'coordinates': coordinates}
+                feature = {
+                    'type': 'Feature',
+                    'geometry': geometry,
+                    'properties': {
+                        'ride': number,
+                        'times': [_format_time(time)
+                                  for time in chunk.times[first:last]]}}
+                file.write(json.dumps(feature) + '\n')
+                first = last
+            rows += len(chunk)
+    return rows
+
+
+def write_columnar(chunks: Iterable[TrajectoryChunk], path: str) -> int:
+    """Write <chunks> to a binary columnar file at <path>, and return the
+    number of rows written.
+    """
+    rows = 0
+    with open(path, 'wb') as file:
+        file.write(COLUMNAR_MAGIC)
+        for chunk in chunks:
+            file.write(struct.pack('<Q', len(chunk)))
+            for column in _columns(chunk):
+                if sys.byteorder == 'big':
+                    column = array(column.typecode, column)
+                    column.byteswap()
+                file.write(column.tobytes())
+            rows += len(chunk)
+    return rows
+
+
+def read_columnar(path: str) -> Iterator[TrajectoryChunk]:
+    """Yield the chunks of the binary columnar file at <path>.
+
+    Raise a ValueError if <path> is not such a file.
+    """
+    with open(path, 'rb') as file:
+        if file.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError('{} is not a trajectory file'.format(path))
+        while True:
+            header = file.read(8)
+            if not header:
+                return
+            rows, = struct.unpack('<Q', header)
+            chunk = TrajectoryChunk()
+            for column in _columns(chunk):
+                column.frombytes(file.read(rows * column.itemsize))
+                if sys.byteorder == 'big':
+                    column.byteswap()
+            yield chunk
+
+
+def _columns(chunk: TrajectoryChunk) -> List[array]:
+    """Return the columns of <chunk>, in the order they are stored."""
+    return [chunk.rides, chunk.times, chunk.longitudes, chunk.latitudes]
+
+
+@lru_cache(maxsize=1 << 16)
+def _format_time(seconds: int) -> str:
+    """Return the time <seconds> after EPOCH in TIME_FORMAT.
+
+    Results are cached, since the same grid times appear in many rides.
+    """
+    return (EPOCH + timedelta(seconds=seconds)).strftime(TIME_FORMAT)
+
+
+# The writer of each export format
+WRITERS: Dict[str, Callable[[Iterable[TrajectoryChunk], str], int]] = {
+    'csv': write_csv,
+    'geojsonl': write_geojsonl,
+    'columnar': write_columnar,
+}
+
+
+def export_trajectories(rides: Iterable[Ride], path: str, start: datetime,
+                        end: datetime, step: int = 10,
+                        file_format: str = 'csv',
+                        chunk_rows: int = CHUNK_ROWS) -> int:
+    """Export the positions of <rides> every <step> seconds from <start> to
+    <end> to <path> in <file_format> ('csv', 'geojsonl' or 'columnar'), and
+    return the number of positions written.
+
+    Raise a ValueError if the format is unknown.
+    """
+    if file_format not in WRITERS:
+        raise ValueError('unknown trajectory format {}'.format(file_format))
+    return WRITERS[file_format](
+        iter_chunks(rides, start, end, step, chunk_rows), path)
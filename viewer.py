@@ -0,0 +1,352 @@
+"""Assignment 1 - Interactive viewer
+
+=== Module Description ===
+
+This file contains an interactive viewer that shows a simulation while it
+runs, without slowing it down to the speed of the display.
+
+The simulation runs headless in a worker process (or thread), as the
+producer: at the end of every minute, a FrameProducer takes a compact
+snapshot of the positions of the active rides (a Frame) and puts it in a
+bounded queue. It never waits for the viewer: when the queue is full, the
+frame is dropped before it is built.
+
+The viewer, in the main process, is the consumer: it moves every frame
+from the queue into a Playback, which keeps a bounded history of frames,
+and draws one frame per display refresh with the Visualizer. While live,
+it draws the newest frame and skips the ones in between. The history can
+be paused, replayed and scrubbed with the keyboard:
+  - space: pause, or play from the current frame
+  - left / right: pause and step one frame back / forward
+  - end: go back to the newest frame
+"""
+from array import array
+from collections import deque
+from datetime import datetime
+import queue
+import sys
+import threading
+import time
+from multiprocessing import Event, Process, Queue
+from typing import Deque, List, Optional, Tuple, Union
+
+from bikeshare import RIDE_SPRITE, Drawable, from_minutes
+from simulation import DATETIME_FORMAT, Simulation, create_stations
+
+# The default number of frames that the queue between the simulation and
+# the viewer can hold
+QUEUE_FRAMES = 64
+
+# The default number of frames kept for replay (one day of minutes)
+HISTORY_FRAMES = 24 * 60
+
+# The default number of frames drawn per second
+FRAME_RATE = 30
+
+# How long the producer waits between attempts to send the end of the run,
+# in seconds
+END_RETRY = 0.1
+
+
+class Frame:
+    """The positions of the active rides at the end of one minute.
+
+    === Attributes ===
+    minute:
+        the minute of this frame, in minutes since EPOCH
+    positions:
+        the longitude and latitude of each active ride, one after the other
+    """
+    minute: int
+    positions: array
+
+    def __init__(self, minute: int, positions: array) -> None:
+        """Initialize a new frame."""
+        self.minute = minute
+        self.positions = positions
+
+    def __len__(self) -> int:
+        """Return the number of rides in this frame."""
+        return len(self.positions) // 2
+
+    def markers(self) -> List['RideMarker']:
+        """Return a drawable for each ride in this frame."""
+        positions = self.positions
+        return [RideMarker((positions[i], positions[i + 1]))
+                for i in range(0, len(positions), 2)]
+
+
+class RideMarker(Drawable):
+    """A ride drawn at a fixed position.
+
+    === Attributes ===
+    position:
+        the (long, lat) position of the ride
+    """
+    __slots__ = ('position',)
+    position: Tuple[float, float]
+
+    def __init__(self, position: Tuple[float, float]) -> None:
+        """Initialize a marker at <position>."""
+        Drawable.__init__(self, RIDE_SPRITE)
+        self.position = position
+
+    def get_position(self, time: datetime) -> Tuple[float, float]:
+        """Return the position of this marker, which does not depend on
+        <time>.
+        """
+        return self.position
+
+
+class _Stopped(Exception):
+    """Raised in the producer to end a run early."""
+
+
+class FrameProducer:
+    """Sends a frame of a simulation to a queue at the end of every minute.
+
+    === Attributes ===
+    simulation:
+        the simulation the frames are taken from
+    frames:
+        the bounded queue the frames are sent to
+    sent:
+        the number of frames sent
+    dropped:
+        the number of frames dropped because the queue was full
+    """
+    simulation: Simulation
+    frames: Union[queue.Queue, Queue]
+    sent: int
+    dropped: int
+
+    # === Private attributes ===
+    # _stop: set to end the run at the end of the current minute, or None.
+    _stop: Optional[threading.Event]
+
+    def __init__(self, simulation: Simulation,
+                 frames: Union[queue.Queue, Queue],
+                 stop: Optional[threading.Event] = None) -> None:
+        """Send the frames of <simulation> to <frames> from now on, until
+        <stop> is set.
+        """
+        self.simulation = simulation
+        self.frames = frames
+        self.sent = 0
+        self.dropped = 0
+        self._stop = stop
+        simulation.add_tick_listener(self._on_tick)
+
+    def _on_tick(self, minute: int) -> None:
+        """Send the frame of <minute>, unless the queue is full."""
+        if self._stop is not None and self._stop.is_set():
+            raise _Stopped
+        if self.frames.full():
+            self.dropped += 1
+            return
+        positions = array('d')
+        for ride in self.simulation.active_rides:
+            start_x, start_y = ride.start.location
+            end_x, end_y = ride.end.location
+            # The same arithmetic as Ride.get_position, on a whole minute
+            fraction = (minute - ride.start_minute) / (
+                ride.end_minute - ride.start_minute)
+            positions.append(start_x + (end_x - start_x) * fraction)
+            positions.append(start_y + (end_y - start_y) * fraction)
+        try:
+            # full() is only approximate for a multiprocessing queue
+            self.frames.put_nowait(Frame(minute, positions))
+            self.sent += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+def produce_frames(stations_file: str, rides_file: str, start: datetime,
+                   end: datetime, frames: Union[queue.Queue, Queue],
+                   stop: threading.Event) -> None:
+    """Run a headless simulation of the given files from <start> to <end>,
+    sending its frames to <frames>, and then send None to mark the end.
+
+    The run ends early if <stop> is set.
+    """
+    sim = Simulation(stations_file, rides_file, visualize=False)
+    FrameProducer(sim, frames, stop)
+    try:
+        sim.run(start, end)
+    except _Stopped:
+        return
+    while not stop.is_set():
+        try:
+            frames.put(None, timeout=END_RETRY)
+            return
+        except queue.Full:
+            pass
+
+
+class Playback:
+    """The frames received from a producer, and the viewer's place in them.
+
+    === Attributes ===
+    frames:
+        the most recent frames received, oldest first
+    position:
+        the index in frames of the frame shown, or None to show the newest
+        frame (live)
+    playing:
+        whether the frame shown moves forward on every advance
+    finished:
+        whether the producer has sent all of its frames
+
+    === Representation Invariants ===
+    - position is None or 0 <= position < len(frames)
+    """
+    frames: Deque[Frame]
+    position: Optional[int]
+    playing: bool
+    finished: bool
+
+    def __init__(self, history: int = HISTORY_FRAMES) -> None:
+        """Initialize an empty playback keeping at most <history> frames."""
+        self.frames = deque(maxlen=history)
+        self.position = None
+        self.playing = True
+        self.finished = False
+
+    def receive(self, frames: Union[queue.Queue, Queue]) -> int:
+        """Move every frame waiting in <frames> to the history, and return
+        how many there were.
+
+        The oldest frames are forgotten when the history is full.
+        """
+        received = 0
+        while True:
+            try:
+                frame = frames.get_nowait()
+            except queue.Empty:
+                return received
+            if frame is None:
+                self.finished = True
+                continue
+            if len(self.frames) == self.frames.maxlen and \
+                    self.position is not None:
+                # The frame shown moves towards the front of the history
+                self.position = max(0, self.position - 1)
+            self.frames.append(frame)
+            received += 1
+
+    def current(self) -> Optional[Frame]:
+        """Return the frame to show, or None if there is none yet."""
+        if not self.frames:
+            return None
+        if self.position is None:
+            return self.frames[-1]
+        return self.frames[self.position]
+
+    def _index(self) -> int:
+        """Return the index of the frame shown."""
+        if self.position is None:
+            return len(self.frames) - 1
+        return self.position
+
+    def toggle_pause(self) -> None:
+        """Pause on the frame shown, or play forward from it."""
+        if self.playing:
+            self.playing = False
+            self.position = max(0, self._index())
+        else:
+            self.playing = True
+
+    def scrub(self, offset: int) -> None:
+        """Pause and move <offset> frames forward (or back, if negative)."""
+        if not self.frames:
+            return
+        self.playing = False
+        self.position = min(len(self.frames) - 1,
+                            max(0, self._index() + offset))
+
+    def live(self) -> None:
+        """Play from the newest frame on."""
+        self.playing = True
+        self.position = None
+
+    def advance(self) -> None:
+        """Move to the next frame if playing a past frame; once the newest
+        frame is reached, follow the newest frames again.
+        """
+        if self.playing and self.position is not None:
+            self.position += 1
+            if self.position >= len(self.frames) - 1:
+                self.position = None
+
+
+def start_producer(stations_file: str, rides_file: str, start: datetime,
+                   end: datetime, queue_frames: int = QUEUE_FRAMES,
+                   use_process: bool = True) \
+        -> Tuple[Union[queue.Queue, Queue], Union[Process, threading.Thread],
+                 threading.Event]:
+    """Start a simulation of the given files from <start> to <end> in a
+    worker process (or thread, if not <use_process>), and return the queue
+    of its frames, the worker, and the event that stops it.
+    """
+    if use_process:
+        frames, stop, worker_type = Queue(queue_frames), Event(), Process
+    else:
+        frames, stop = queue.Queue(queue_frames), threading.Event()
+        worker_type = threading.Thread
+    worker = worker_type(target=produce_frames, daemon=True,
+                         args=(stations_file, rides_file, start, end,
+                               frames, stop))
+    worker.start()
+    return frames, worker, stop
+
+
+def run_viewer(stations_file: str, rides_file: str, start: datetime,
+               end: datetime, queue_frames: int = QUEUE_FRAMES,
+               history: int = HISTORY_FRAMES, frame_rate: int = FRAME_RATE,
+               use_process: bool = True) -> None:
+    """Show a simulation of the given files from <start> to <end> until the
+    window is closed.
+    """
+    import pygame
+    from visualizer import Visualizer
+
+    frames, worker, stop = start_producer(stations_file, rides_file, start,
+                                          end, queue_frames, use_process)
+    visualizer = Visualizer()
+    stations = list(create_stations(stations_file).values())
+    playback = Playback(history)
+    keys = {pygame.K_SPACE: playback.toggle_pause,
+            pygame.K_LEFT: lambda: playback.scrub(-1),
+            pygame.K_RIGHT: lambda: playback.scrub(1),
+            pygame.K_END: playback.live}
+    try:
+        while True:
+            playback.receive(frames)
+            for event in pygame.event.get(pygame.KEYDOWN):
+                if event.key in keys:
+                    keys[event.key]()
+            if visualizer.handle_window_events():
+                return
+            frame = playback.current()
+            if frame is not None:
+                visualizer.render_drawables(stations + frame.markers(),
+                                            from_minutes(frame.minute))
+            playback.advance()
+            time.sleep(1 / frame_rate)
+    finally:
+        stop.set()
+        worker.join(1)
+        if use_process and worker.is_alive():
+            worker.terminate()
+
+
+if __name__ == '__main__':
+    # Usage: python viewer.py [stations.json rides.csv START END], with the
+    # times in DATETIME_FORMAT. Shows the sample rides by default.
+    if len(sys.argv) == 5:
+        run_viewer(sys.argv[1], sys.argv[2],
+                   datetime.strptime(sys.argv[3], DATETIME_FORMAT),
+                   datetime.strptime(sys.argv[4], DATETIME_FORMAT))
+    else:
+        run_viewer('stations.json', 'sample_rides.csv',
+                   datetime(2017, 6, 1, 8, 0), datetime(2017, 6, 1, 9, 0))